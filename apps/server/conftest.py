@@ -0,0 +1,127 @@
+"""
+Test harness for the engine: a fresh `main` module per test, a controllable
+clock, deterministic vector hashes and a small EA/broker double that speaks
+the delta position protocol.
+"""
+
+import importlib
+import random
+import sys
+import time
+import uuid
+
+import pytest
+
+
+class Clock:
+    """Stands in for the `time` module inside main; time() and monotonic() are simulated."""
+
+    def __init__(self, start: float = 1_700_000_000.0):
+        self.now = start
+
+    def time(self) -> float:
+        return self.now
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def __getattr__(self, name):
+        return getattr(time, name)
+
+
+class SeededUuid:
+    """Stands in for the `uuid` module inside main so hashes repeat across runs."""
+
+    def __init__(self, seed: int):
+        self.rng = random.Random(seed)
+
+    def uuid4(self) -> uuid.UUID:
+        return uuid.UUID(int=self.rng.getrandbits(128))
+
+
+class Broker:
+    """
+    EA + broker double: fills BUY/SELL at the quote, closes baskets on
+    CLOSE_ALL, marks positions to market and reports changes as v2 deltas.
+    """
+
+    def __init__(self, engine, contract: float = 100.0):
+        self.engine = engine
+        self.contract = contract
+        self.positions = {}
+        self.next_ticket = 1000
+        self.closed = []
+        self.full = True
+        self.reported = {}
+
+    def _mark(self, ask: float, bid: float):
+        for p in self.positions.values():
+            if p["type"] == "BUY":
+                p["profit"] = round((bid - p["price"]) * p["volume"] * self.contract, 2)
+            else:
+                p["profit"] = round((p["price"] - ask) * p["volume"] * self.contract, 2)
+
+    def close_matching(self, prefix: str = ""):
+        """Close every position whose comment starts with `prefix` (all if empty)."""
+        for ticket in [t for t, p in self.positions.items() if p["comment"].startswith(prefix)]:
+            del self.positions[ticket]
+            self.closed.append(ticket)
+
+    def _execute(self, response: dict, ask: float, bid: float):
+        action = response.get("action")
+        if action in ("BUY", "SELL"):
+            self.positions[self.next_ticket] = {
+                "ticket": self.next_ticket, "symbol": "XAUUSD", "type": action,
+                "volume": response["volume"], "price": ask if action == "BUY" else bid,
+                "profit": 0.0, "comment": response["comment"],
+            }
+            self.next_ticket += 1
+        elif action == "CLOSE_ALL":
+            # Like the EA: no comment is ignored, "server" closes everything
+            comment = response.get("comment", "")
+            if comment:
+                self.close_matching("" if comment == "server" else comment + "_")
+        if response.get("resync"):
+            self.full = True
+
+    def tick(self, ask: float, bid: float, request_id: str = None, lost: bool = False) -> dict:
+        """Send one tick; a `lost` response never reaches the EA, so nothing is executed or acknowledged."""
+        self._mark(ask, bid)
+        payload = {
+            "account_id": "1", "equity": 10000.0, "balance": 10000.0, "symbol": "XAUUSD",
+            "ask": ask, "bid": bid, "protocol": 2,
+            "book_count": len(self.positions),
+            "book_ticket_sum": sum(self.positions),
+        }
+        if request_id:
+            payload["request_id"] = request_id
+        if self.full:
+            payload["full"] = True
+            payload["positions"] = list(self.positions.values())
+        else:
+            payload["upserts"] = [p for t, p in self.positions.items() if self.reported.get(t) != p]
+            payload["closed"] = self.closed
+
+        response = self.engine.dispatch_tick(self.engine.TickData(**payload))
+        if lost:
+            return response
+        self.reported = {t: dict(p) for t, p in self.positions.items()}
+        self.closed = []
+        self.full = False
+        self._execute(response, ask, bid)
+        return response
+
+
+@pytest.fixture
+def fresh_engine(tmp_path, monkeypatch):
+    """Factory for a freshly imported engine with its own state file, clock and hash seed."""
+    def make(seed: int = 0):
+        monkeypatch.setenv("STATE_FILE", str(tmp_path / f"state-{seed}.json"))
+        monkeypatch.delenv("REPLICATION_LISTEN", raising=False)
+        monkeypatch.delenv("REPLICATION_PRIMARY", raising=False)
+        engine = importlib.reload(sys.modules["main"]) if "main" in sys.modules else importlib.import_module("main")
+        engine.time = Clock()
+        engine.uuid = SeededUuid(seed)
+        return engine
+
+    return make
@@ -8,27 +8,86 @@ Version:  3.4.2
 """
 
 import json
+import copy
 import uuid
 import os
+import sys
+import threading
+import asyncio
 import traceback
 import re
 import time
+import math
+import bisect
+import zlib
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Dict, Optional
 from datetime import datetime
-from collections import deque
+from collections import deque, OrderedDict, Counter
 from fastapi import FastAPI, Body, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
 from fastapi.exceptions import RequestValidationError
 from pydantic import BaseModel, Field
 
 # --- Configuration ---
-STATE_FILE = "state.json"
+STATE_FILE = os.environ.get("STATE_FILE", "state.json")
+SERVER_PORT = int(os.environ.get("PORT", "8000"))
 PRICE_HISTORY_LEN = 100
 # Regex to identify trades managed by this system. Format: "buy_HASH_idx0"
 TRADE_ID_PATTERN = re.compile(r"^(sell|buy)_[0-9a-fA-F]{8}_idx\d+$")
 # Grace period: Wait for broker to acknowledge trades before checking external close
 EXTERNAL_CLOSE_GRACE_PERIOD = 5.0  # seconds
+# Highest tick protocol understood by this server (2 = delta positions)
+TICK_PROTOCOL_VERSION = 2
+
+# Replication (Hot Standby)
+ENGINE_ROLE = os.environ.get("ENGINE_ROLE", "primary")            # "primary" | "standby"
+REPLICATION_LISTEN = os.environ.get("REPLICATION_LISTEN", "")      # primary: "host:port" to stream state from
+REPLICATION_PRIMARY = os.environ.get("REPLICATION_PRIMARY", "")    # standby: primary's "host:port"
+REPLICATION_HEARTBEAT = 0.2  # seconds between primary heartbeats
+REPLICATION_TIMEOUT = 0.6    # seconds of primary silence (3 heartbeats) before a standby accepts failed-over ticks
+REPLICATION_RECONNECT = 5.0  # seconds of silence before the standby re-dials the primary
+REPLICATION_MAX_BUFFER = 4 * 1024 * 1024  # drop standbys that stop reading
+
+# Idempotent Dispatch: replay the recorded answer when the EA retries a tick
+DISPATCH_CACHE_SIZE = 512     # remembered request ids
+DISPATCH_CACHE_TTL = 120.0    # seconds a decision stays replayable
+
+# Vector Layers: name of the layer stored in state.settings / state.runtime
+MAIN_LAYER = "main"
+LAYER_NAME_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,32}$")
+
+# Fill Tracing: decision -> broker fill latency and slippage per strata
+FILL_TRACE_TIMEOUT = 300.0    # seconds before an unmatched decision counts as unfilled
+SLIPPAGE_BOUNDS_BPS = [i / 2.0 for i in range(-100, 101)]  # -50..+50 bps in 0.5 bps buckets
+
+# Backlog Ingestion: ticks buffered by the EA while the engine was unreachable
+BACKLOG_MAX_TICKS = 100000    # ~28 h of 1 s polling per upload (matches the EA's InpBacklogMax)
+BACKLOG_MAX_BYTES = 8 * 1024 * 1024  # upload size, compressed or inflated
+
+# Volatility Statistics (streaming, O(1) per tick)
+VOL_WINDOW = 100              # samples in the rolling ATR / realized-volatility window
+VOL_MIN_INTERVAL = 0.1        # seconds; quotes closer together fold into the next sample
+VOL_EWMA_LAMBDA = 0.94        # decay of the EWMA variance (RiskMetrics style)
+VOL_WARMUP = 20               # ticks before the volatility grid mode starts scaling
+VOL_SCALE_TOLERANCE = 0.05    # relative change of the gap factor before levels move
+
+# Poll Interval Hints: /api/tick tells the EA when to call again
+POLL_MIN_MS = 250             # near a trigger or mid-transition (orders, closing, init)
+POLL_MAX_MS = 5000            # nothing armed or triggers far away
+POLL_DEFAULT_MS = 1000        # volatility still warming up
+POLL_SIGMA = 3.0              # poll before a POLL_SIGMA move could reach the nearest trigger
+POLL_SAFETY = 0.5             # fraction of that time actually waited
+
+# Profiling (admin): in-process stack sampling / traced tick calls
+PROFILE_MAX_SECONDS = 60.0    # longest sampling window or wait for traced ticks
+PROFILE_MIN_INTERVAL_MS = 1.0 # fastest stack sampling rate
+
+# Scheduling: "shared" runs everything on the event loop; "priority" gives ticks
+# the loop and moves dashboard/analytics serialization to a worker pool
+SCHEDULING_MODE = os.environ.get("SCHEDULING_MODE", "shared")
+UI_POOL_WORKERS = 2
 
 # --- Data Models ---
 
@@ -37,6 +96,7 @@ class GridRow(BaseModel):
     dollar: float  # Gap distance in price
     lots: float    # Volume for this strata
     alert: bool = False
+    version: int = 0  # settings_version stamp of the last change (optimistic locking)
 
 class Position(BaseModel):
     ticket: int
@@ -55,6 +115,20 @@ class TickData(BaseModel):
     ask: float
     bid: float
     positions: List[Position] = []
+    
+    # Delta Protocol (v2): Only opened/changed/closed positions are sent.
+    # `full` marks a complete snapshot in `positions` (startup / resync).
+    protocol: int = 1
+    full: bool = False
+    upserts: List[Position] = []
+    closed: List[int] = []
+    
+    # Book checksum (v2): Count and ticket sum of the client's position set
+    book_count: Optional[int] = None
+    book_ticket_sum: Optional[int] = None
+    
+    # Client-generated id, identical across retries of the same tick
+    request_id: Optional[str] = None
 
 class RowExecStats(BaseModel):
     index: int
@@ -64,6 +138,8 @@ class RowExecStats(BaseModel):
     timestamp: str
     cumulative_lots: float = 0.0
     cumulative_profit: float = 0.0
+    # Volatility gap factor this strata was executed with; its gap stays frozen at that scale
+    gap_scale: float = 1.0
 
 class RuntimeState(BaseModel):
     buy_on: bool = False
@@ -124,147 +200,991 @@ class UserSettings(BaseModel):
     # The Grid Strata
     rows_buy: List[GridRow] = []
     rows_sell: List[GridRow] = []
+    
+    # settings_version stamps of the last change to each side's TP/hedge/limit fields
+    buy_version: int = 0
+    sell_version: int = 0
+    
+    # Grid Mode: "fixed" gaps, or "volatility" = gaps scaled by ATR / vol_reference_atr (both per sqrt(second))
+    grid_mode: str = "fixed"
+    vol_reference_atr: float = 0.0
+    vol_scale_min: float = 0.5
+    vol_scale_max: float = 3.0
+
+class RowPatch(BaseModel):
+    index: int = -1
+    dollar: Optional[float] = None
+    lots: Optional[float] = None
+    alert: Optional[bool] = None
+    expected_version: Optional[int] = None
+
+class RowRangePatch(BaseModel):
+    rows: List[RowPatch]
+
+class SidePatch(BaseModel):
+    limit_price: Optional[float] = None
+    tp_type: Optional[str] = None
+    tp_value: Optional[float] = None
+    hedge_value: Optional[float] = None
+    expected_version: Optional[int] = None
+
+class VectorLayer(BaseModel):
+    """An additional, independent buy/sell vector pair with its own hashes, anchors, rows, TP and hedge."""
+    settings: UserSettings = Field(default_factory=UserSettings)
+    runtime: RuntimeState = Field(default_factory=RuntimeState)
+
+class ProfileRequest(BaseModel):
+    mode: str = "sample"        # "sample" = wall-clock stack sampling, "ticks" = trace /api/tick calls
+    seconds: float = 5.0        # sampling window, or how long to wait for traced ticks
+    interval_ms: float = 5.0    # sample mode: time between stack samples
+    all_threads: bool = False   # sample mode: also keep stacks without engine frames (idle loop etc.)
+    ticks: int = 20             # ticks mode: number of calls to trace
+    every: int = 1              # ticks mode: trace every Nth call
 
 class SystemState(BaseModel):
+    # The main layer (market data and error status also live in this runtime)
     settings: UserSettings = Field(default_factory=UserSettings)
     runtime: RuntimeState = Field(default_factory=RuntimeState)
+    # Extra layers by name, evaluated after the main layer on every tick
+    layers: Dict[str, VectorLayer] = {}
     last_update_ts: str = ""
+    # Monotonic counter; every settings change stamps the touched rows/fields with it
+    settings_version: int = 0
+    # Incremented on every standby takeover; clients ignore lower tokens
+    fence_token: int = 0
+
+# --- Position Book ---
+
+class PositionBook:
+    """
+    Authoritative view of the broker's open positions, keyed by ticket.
+    
+    Managed positions (TRADE_ID_PATTERN) are additionally indexed by their
+    vector hash so basket profit, volume, P/L per point and trade counts are
+    O(1) lookups. Totals are adjusted by each changed ticket's old and new
+    contribution, so a delta costs O(changes); a full sync re-sums them.
+    """
+    
+    def __init__(self):
+        self.positions: Dict[int, Position] = {}
+        self.vectors: Dict[str, Dict[int, Position]] = {}
+        self.totals: Dict[str, tuple] = {}  # hash -> (count, profit, volume, per_point)
+        # ticket -> |profit| / |close - open| at its last upsert (P/L change per unit of price)
+        self.per_points: Dict[int, float] = {}
+        self.quote = (0.0, 0.0)  # (bid, ask) of the delta being applied
+        self.ticket_sum = 0
+        self.synced = False
+        # Managed positions upserted since the last drain (for exec stats)
+        self.changes: Dict[int, Position] = {}
+        # True if tickets were opened or closed during the last ingest
+        self.membership_changed = False
+        # Managed positions that appeared during the last ingest
+        self.opened: List[Position] = []
+    
+    @staticmethod
+    def vector_of(p: Position) -> str:
+        if not TRADE_ID_PATTERN.match(p.comment):
+            return ""
+        return p.comment.split("_idx")[0]
+    
+    def _contribute(self, hash_id: str, p: Position, per_point: float, sign: int):
+        """Add (sign=1) or subtract (sign=-1) one position's share of its vector's totals."""
+        count, profit, volume, points = self.totals.get(hash_id, (0, 0.0, 0.0, 0.0))
+        count += sign
+        if count <= 0:
+            # An empty vector starts over from exact zeros
+            self.totals.pop(hash_id, None)
+            return
+        self.totals[hash_id] = (count, profit + sign * p.profit, volume + sign * p.volume, points + sign * per_point)
+    
+    def _remove(self, ticket: int):
+        old = self.positions.pop(ticket, None)
+        if old is None:
+            return
+        per_point = self.per_points.pop(ticket, 0.0)
+        self.ticket_sum -= ticket
+        self.membership_changed = True
+        hash_id = self.vector_of(old)
+        if hash_id:
+            group = self.vectors.get(hash_id, {})
+            group.pop(ticket, None)
+            if not group:
+                self.vectors.pop(hash_id, None)
+            self._contribute(hash_id, old, per_point, -1)
+    
+    def _upsert(self, p: Position):
+        old = self.positions.get(p.ticket)
+        if old == p:
+            return
+        if old is not None and self.vector_of(old) != self.vector_of(p):
+            self._remove(p.ticket)
+            old = None
+        if old is None:
+            self.ticket_sum += p.ticket
+            self.membership_changed = True
+        self.positions[p.ticket] = p
+        hash_id = self.vector_of(p)
+        if hash_id:
+            per_point = self.per_points.get(p.ticket, 0.0)
+            if old is not None:
+                self._contribute(hash_id, old, per_point, -1)
+            bid, ask = self.quote
+            moved = abs((bid if p.type == "BUY" else ask) - p.price)
+            if moved > 0:
+                per_point = self.per_points[p.ticket] = abs(p.profit) / moved
+            self._contribute(hash_id, p, per_point, 1)
+            self.vectors.setdefault(hash_id, {})[p.ticket] = p
+            self.changes[p.ticket] = p
+            if old is None:
+                self.opened.append(p)
+    
+    def _resum(self):
+        """Recompute every total from scratch, bounding floating-point drift of the running sums."""
+        self.totals = {
+            hash_id: (
+                len(group),
+                sum(p.profit for p in group.values()),
+                sum(p.volume for p in group.values()),
+                sum(self.per_points.get(t, 0.0) for t in group),
+            )
+            for hash_id, group in self.vectors.items()
+        }
+    
+    def apply(self, upserts: List[Position], closed: List[int], bid: float = 0.0, ask: float = 0.0):
+        """Apply a delta: opened/changed positions and closed tickets, marked at the tick's quote."""
+        self.quote = (bid, ask)
+        self.membership_changed = False
+        self.opened = []
+        for ticket in closed:
+            self._remove(ticket)
+        for p in upserts:
+            self._upsert(p)
+    
+    def sync(self, positions: List[Position], bid: float = 0.0, ask: float = 0.0):
+        """Reconcile the book against a full snapshot (legacy / resync)."""
+        incoming = {p.ticket for p in positions}
+        closed = [t for t in self.positions if t not in incoming]
+        self.apply(positions, closed, bid, ask)
+        self._resum()
+        self.synced = True
+    
+    def matches(self, count: int, ticket_sum: int) -> bool:
+        return count == len(self.positions) and ticket_sum == self.ticket_sum
+    
+    def drain_changes(self) -> List[Position]:
+        changed = list(self.changes.values())
+        self.changes = {}
+        return changed
+    
+    def count(self, hash_id: str) -> int:
+        if not hash_id: return 0
+        return self.totals.get(hash_id, (0, 0.0, 0.0, 0.0))[0]
+    
+    def profit(self, hash_id: str) -> float:
+        return self.totals.get(hash_id, (0, 0.0, 0.0, 0.0))[1]
+    
+    def volume(self, hash_id: str) -> float:
+        return self.totals.get(hash_id, (0, 0.0, 0.0, 0.0))[2]
+    
+    def per_point(self, hash_id: str) -> float:
+        """Basket P/L change per unit of price."""
+        return self.totals.get(hash_id, (0, 0.0, 0.0, 0.0))[3]
+
+# --- Metrics ---
+
+class Histogram:
+    """Fixed-bucket histogram: O(1) record, percentiles interpolated from bucket edges."""
+    
+    def __init__(self, bounds: List[float]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+    
+    @classmethod
+    def log_spaced(cls, lo: float, hi: float, per_decade: int = 20) -> "Histogram":
+        steps = int(round(per_decade * math.log10(hi / lo)))
+        return cls([lo * 10 ** (i / per_decade) for i in range(steps + 1)])
+    
+    def copy(self) -> "Histogram":
+        clone = copy.copy(self)
+        clone.counts = self.counts.copy()
+        return clone
+    
+    def record(self, value: float):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+    
+    def percentile(self, q: float) -> float:
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, c in enumerate(self.counts):
+            if c and seen + c >= rank:
+                lo = self.bounds[i - 1] if i > 0 else self.min
+                hi = self.bounds[i] if i < len(self.bounds) else self.max
+                lo, hi = max(lo, self.min), min(hi, self.max)
+                return lo + (hi - lo) * ((rank - seen) / c)
+            seen += c
+        return self.max
+    
+    def summary(self, scale: float = 1.0) -> dict:
+        if not self.count:
+            return {"count": 0}
+        return {
+            "count": self.count,
+            "mean": self.total / self.count * scale,
+            "p50": self.percentile(0.50) * scale,
+            "p90": self.percentile(0.90) * scale,
+            "p99": self.percentile(0.99) * scale,
+            "max": self.max * scale,
+        }
+
+class VolatilityTracker:
+    """
+    Rolling ATR (mean |mid change|), realized volatility (RMS log return) and
+    EWMA volatility over the tick stream, each normalised to one second
+    (|dmid| / sqrt(dt), r^2 / dt) so they do not depend on how often the EA
+    polls. Every update is O(1): the rolling windows keep running sums that
+    are re-summed exactly once per window pass.
+    """
+    
+    def __init__(self, window: int = VOL_WINDOW, lam: float = VOL_EWMA_LAMBDA):
+        self.window = window
+        self.lam = lam
+        self.reset()
+    
+    def reset(self):
+        self.ranges = deque()
+        self.sq_returns = deque()
+        self.range_sum = 0.0
+        self.sq_sum = 0.0
+        self.ewma_var = 0.0
+        self.last_mid: Optional[float] = None
+        self.last_ts = 0.0
+        self.count = 0
+    
+    def update(self, mid: float, ts: float):
+        last = self.last_mid
+        if last is None or last <= 0 or mid <= 0:
+            self.last_mid, self.last_ts = mid, ts
+            return
+        dt = ts - self.last_ts
+        if dt < VOL_MIN_INTERVAL:
+            # Too close to the previous sample: the move counts towards the next one
+            return
+        self.last_mid, self.last_ts = mid, ts
+        
+        true_range = abs(mid - last) / math.sqrt(dt)
+        ret = math.log(mid / last)
+        sq_return = ret * ret / dt
+        self.ranges.append(true_range)
+        self.sq_returns.append(sq_return)
+        self.range_sum += true_range
+        self.sq_sum += sq_return
+        if len(self.ranges) > self.window:
+            self.range_sum -= self.ranges.popleft()
+            self.sq_sum -= self.sq_returns.popleft()
+        
+        self.ewma_var = sq_return if self.count == 0 else self.lam * self.ewma_var + (1 - self.lam) * sq_return
+        self.count += 1
+        
+        # Bound floating-point drift of the running sums
+        if self.count % self.window == 0:
+            self.range_sum = sum(self.ranges)
+            self.sq_sum = sum(self.sq_returns)
+    
+    @property
+    def atr(self) -> float:
+        return self.range_sum / len(self.ranges) if self.ranges else 0.0
+    
+    @property
+    def realized_vol(self) -> float:
+        return math.sqrt(max(self.sq_sum, 0.0) / len(self.sq_returns)) if self.sq_returns else 0.0
+    
+    @property
+    def ewma_vol(self) -> float:
+        return math.sqrt(self.ewma_var)
+    
+    def snapshot(self) -> dict:
+        return {
+            "samples": self.count,
+            "atr": self.atr,
+            "realized_vol": self.realized_vol,
+            "ewma_vol": self.ewma_vol,
+        }
+
+class DispatchCache:
+    """
+    Bounded, time-expiring map of tick request_id -> response. A retried tick
+    gets the exact decision it was originally given instead of a re-evaluation,
+    so a lost response can never double-fill a strata.
+    """
+    
+    def __init__(self, size: int = DISPATCH_CACHE_SIZE, ttl: float = DISPATCH_CACHE_TTL):
+        self.size = size
+        self.ttl = ttl
+        self.entries: "OrderedDict[str, tuple]" = OrderedDict()  # id -> (stored_at, response)
+    
+    def _expire(self, now: float):
+        while self.entries:
+            stored_at, _ = next(iter(self.entries.values()))
+            if now - stored_at < self.ttl:
+                break
+            self.entries.popitem(last=False)
+    
+    def get(self, request_id: str) -> Optional[dict]:
+        self._expire(time.monotonic())
+        entry = self.entries.get(request_id)
+        return entry[1] if entry else None
+    
+    def put(self, request_id: str, response: dict):
+        self.entries[request_id] = (time.monotonic(), response)
+        self.entries.move_to_end(request_id)
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+class FillTracer:
+    """
+    Follows each BUY/SELL decision until its position shows up in the book.
+    Decisions are keyed by order comment ("<hash>_idx<n>"), which the broker
+    carries through unchanged, and matched when a ticket with that comment opens.
+    Latency and slippage (basis points, positive = adverse) are kept per layer
+    and strata, since each layer runs its own ladder.
+    """
+    
+    def __init__(self):
+        self.pending: Dict[str, dict] = {}  # comment -> decision
+        self.strata: Dict[str, Dict[str, Dict[int, dict]]] = {}  # layer -> side -> index
+        self.quote_slippage = Histogram(SLIPPAGE_BOUNDS_BPS)  # fill vs decision quote
+        self.filled = 0
+        self.unfilled = 0
+    
+    def _strata(self, layer: str, side: str, idx: int) -> dict:
+        by_idx = self.strata.setdefault(layer, {"buy": {}, "sell": {}})[side]
+        entry = by_idx.get(idx)
+        if entry is None:
+            entry = {
+                "latency": Histogram.log_spaced(1e-3, 600.0),  # seconds
+                "slippage": Histogram(SLIPPAGE_BOUNDS_BPS),    # vs strata target
+            }
+            by_idx[idx] = entry
+        return entry
+    
+    def decided(self, response: dict, tick: TickData, now_ts: float) -> str:
+        comment = response["comment"]
+        side = "buy" if response["action"] == "BUY" else "sell"
+        hash_id, idx = comment.split("_idx")
+        idx = int(idx)
+        layer = layer_of(hash_id) or MAIN_LAYER
+        quote = tick.ask if side == "buy" else tick.bid
+        decision_id = uuid.uuid4().hex[:12]
+        self.pending[comment] = {
+            "id": decision_id,
+            "layer": layer,
+            "side": side,
+            "index": idx,
+            # IronClad hedges fill at market by design; their injected row is no level to measure against
+            "target": quote if response.get("hedge") else calculate_grid_level_price(side, idx, layer),
+            "quote": quote,
+            "ts": now_ts,
+        }
+        return decision_id
+    
+    def observe(self, opened: List[Position], now_ts: float):
+        if not self.pending:
+            return
+        for p in opened:
+            decision = self.pending.pop(p.comment, None)
+            if decision is None:
+                continue
+            sign = 1.0 if decision["side"] == "buy" else -1.0
+            entry = self._strata(decision["layer"], decision["side"], decision["index"])
+            entry["latency"].record(now_ts - decision["ts"])
+            if decision["target"] > 0:
+                entry["slippage"].record(sign * (p.price - decision["target"]) / decision["target"] * 1e4)
+            if decision["quote"] > 0:
+                self.quote_slippage.record(sign * (p.price - decision["quote"]) / decision["quote"] * 1e4)
+            self.filled += 1
+        
+        for comment in [c for c, d in self.pending.items() if now_ts - d["ts"] > FILL_TRACE_TIMEOUT]:
+            print(f"[TRACE] No fill for decision {self.pending[comment]['id']} ({comment})")
+            del self.pending[comment]
+            self.unfilled += 1
+    
+    def copy(self) -> "FillTracer":
+        """Detached copy for reporting off the event loop."""
+        clone = copy.copy(self)
+        clone.pending = self.pending.copy()
+        clone.quote_slippage = self.quote_slippage.copy()
+        clone.strata = {
+            layer: {
+                side: {idx: {k: h.copy() for k, h in entry.items()} for idx, entry in by_idx.items()}
+                for side, by_idx in sides.items()
+            }
+            for layer, sides in self.strata.items()
+        }
+        return clone
+    
+    def summary(self) -> dict:
+        return {
+            "filled": self.filled,
+            "unfilled": self.unfilled,
+            "pending": len(self.pending),
+            "quote_slippage_bps": self.quote_slippage.summary(),
+        }
+    
+    def report(self) -> dict:
+        return {
+            layer: {
+                side: {
+                    str(idx): {
+                        "latency_ms": entry["latency"].summary(scale=1000.0),
+                        "slippage_bps": entry["slippage"].summary(),
+                    }
+                    for idx, entry in sorted(by_idx.items())
+                }
+                for side, by_idx in sides.items()
+            }
+            for layer, sides in sorted(self.strata.items())
+        }
+
+# --- Scheduling (Tick Priority Lane) ---
+
+class TickLane:
+    """
+    In "priority" mode, ticks own the event loop: dashboard/analytics handlers
+    wait until no tick is in flight, take a cheap detached snapshot, and hand
+    the heavy model_dump and JSON encoding to a worker pool.
+    """
+    
+    def __init__(self, mode: str):
+        self.mode = mode
+        self.inflight = 0
+        self._idle: Optional[asyncio.Event] = None
+        self.snapshots: Dict[str, tuple] = {}
+        self.pool = ThreadPoolExecutor(max_workers=UI_POOL_WORKERS, thread_name_prefix="ui-lane") if mode == "priority" else None
+    
+    @property
+    def idle(self) -> asyncio.Event:
+        # Created lazily so it binds to the server's running loop
+        if self._idle is None:
+            self._idle = asyncio.Event()
+            if self.inflight == 0:
+                self._idle.set()
+        return self._idle
+    
+    def enter(self):
+        self.inflight += 1
+        self.idle.clear()
+    
+    def leave(self):
+        self.inflight -= 1
+        if self.inflight == 0:
+            self.idle.set()
+    
+    async def yield_to_ticks(self):
+        if self.pool is not None:
+            await self.idle.wait()
+    
+    async def offload(self, fn, *args):
+        if self.pool is None:
+            return fn(*args)
+        return await asyncio.get_running_loop().run_in_executor(self.pool, fn, *args)
+    
+    @staticmethod
+    def _encode(render, snapshot) -> str:
+        return json.dumps(render(snapshot))
+    
+    async def serve_snapshot(self, name: str, key: tuple, capture, render) -> Response:
+        """
+        Coalesce concurrent readers onto one encoded snapshot per state key.
+        `capture` runs on the loop and must only copy; `render` builds the
+        response body from that copy in the pool.
+        """
+        entry = self.snapshots.get(name)
+        if entry is None or entry[0] != key:
+            encoded = asyncio.ensure_future(self.offload(self._encode, render, capture()))
+            entry = self.snapshots[name] = (key, encoded)
+        body = await entry[1]
+        return Response(content=body, media_type="application/json")
+
+def detach(model: BaseModel) -> BaseModel:
+    """
+    Shallow copy whose list/dict fields are copied too, so the loop can keep
+    mutating the original while a worker serializes the copy. Relies on rows and
+    exec stats being replaced, never edited in place, once they are installed.
+    """
+    return model.model_copy(update={k: v.copy() for k, v in model.__dict__.items() if isinstance(v, (list, dict))})
 
 # --- Global State ---
 state = SystemState()
 price_history = deque(maxlen=PRICE_HISTORY_LEN)
+position_book = PositionBook()
+
+# Bumped on every state mutation; invalidates precomputed trigger levels
+state_epoch = 0
+trigger_cache: Dict[str, object] = {"epoch": -1, "levels": None}
+# Cumulative strata gaps per layer and side (prefix sums of rows[i].dollar * scale), extended lazily
+level_offsets: Dict[str, Dict[str, List[float]]] = {}
+# (gap factor, executed strata) each layer/side's offsets were computed with
+level_basis: Dict[str, Dict[str, tuple]] = {}
+volatility = VolatilityTracker()
+# Gap multiplier per layer applied to level offsets in "volatility" grid mode
+grid_scale: Dict[str, float] = {}
+tick_metrics = {"ticks": 0, "fast_path": 0, "replays": 0, "backlog": 0}
+dispatch_cache = DispatchCache()
+fill_tracer = FillTracer()
+tick_latency = Histogram.log_spaced(1e-5, 10.0)  # seconds spent inside /api/tick
+poll_hints = Histogram.log_spaced(POLL_MIN_MS, POLL_MAX_MS)  # next_poll_ms handed out
+tick_intervals = Histogram.log_spaced(1e-2, 60.0)  # seconds between consecutive ticks
+tick_lane = TickLane(SCHEDULING_MODE)
 
 # --- Persistence Functions ---
 
+def mark_state_changed():
+    global state_epoch
+    state_epoch += 1
+
 def save_state():
+    mark_state_changed()
     try:
         state_dict = state.model_dump()
         state_dict['price_history'] = list(price_history)
+        replicator.publish(state_dict)
         with open(STATE_FILE, "w") as f:
             json.dump(state_dict, f, indent=2)
     except Exception as e:
         print(f"[ERROR] Save State Failed: {e}")
 
-def load_state():
+def restore_state(data: dict):
+    """Replace the in-memory state with a persisted/replicated snapshot."""
     global state, price_history
+    if 'price_history' in data:
+        hist = data.pop('price_history')
+        price_history = deque(hist, maxlen=PRICE_HISTORY_LEN)
+    state = SystemState(**data)
+    level_offsets.clear()
+    level_basis.clear()
+    grid_scale.clear()
+    volatility.reset()
+    for point in price_history:
+        volatility.update(point['mid'], point['ts'])
+    refresh_grid_scale()
+    mark_state_changed()
+
+def load_state():
     if os.path.exists(STATE_FILE):
         try:
             with open(STATE_FILE, "r") as f:
                 data = json.load(f)
-            if 'price_history' in data:
-                hist = data.pop('price_history')
-                price_history = deque(hist, maxlen=PRICE_HISTORY_LEN)
-            state = SystemState(**data)
+            restore_state(data)
             print(f"[INIT] State Restored - Buy:{state.runtime.buy_on} Sell:{state.runtime.sell_on}")
         except Exception as e:
             print(f"[ERROR] Load State Failed: {e}")
     else:
         print("[INIT] No previous state found. Starting fresh.")
 
+# --- Replication (Hot Standby) ---
+
+def parse_host_port(addr: str) -> tuple:
+    host, _, port = addr.rpartition(":")
+    return (host or "0.0.0.0", int(port))
+
+class Replicator:
+    """
+    Streams state snapshots from the primary to hot standbys over TCP
+    (newline-delimited JSON). The standby keeps following for as long as it
+    runs and only promotes itself (with a higher fence token) once the EA has
+    failed over to it and the primary is silent as well. A stalled primary that
+    comes back is told about the promotion and steps down.
+    """
+    
+    def __init__(self):
+        self.role = ENGINE_ROLE  # "primary" | "standby" | "deposed"
+        self.writers: List[asyncio.StreamWriter] = []
+        self.seq = 0
+        self.last_state: Optional[dict] = None
+        self.has_replica = False
+        self.last_heard = 0.0  # monotonic time of the last message from the primary
+        self.upstream: Optional[asyncio.StreamWriter] = None
+        self.server: Optional[asyncio.AbstractServer] = None
+        self.tasks: List[asyncio.Task] = []
+    
+    @property
+    def enabled(self) -> bool:
+        return bool(REPLICATION_LISTEN or REPLICATION_PRIMARY)
+    
+    def _message(self, kind: str, payload: Optional[dict] = None) -> bytes:
+        msg = {"type": kind, "seq": self.seq, "fence": state.fence_token}
+        if payload is not None:
+            msg["state"] = payload
+        return (json.dumps(msg) + "\n").encode()
+    
+    def _send(self, line: bytes):
+        for writer in list(self.writers):
+            if writer.is_closing() or writer.transport.get_write_buffer_size() > REPLICATION_MAX_BUFFER:
+                print("[REPLICA] Dropping stalled standby")
+                self.writers.remove(writer)
+                writer.close()
+                continue
+            writer.write(line)
+    
+    def publish(self, state_dict: dict):
+        """Called by save_state() on the primary with the snapshot it just built."""
+        if self.role != "primary" or not REPLICATION_LISTEN:
+            return
+        self.seq += 1
+        self.last_state = state_dict
+        if self.writers:
+            self._send(self._message("state", state_dict))
+    
+    async def start(self):
+        if self.role == "standby" and REPLICATION_PRIMARY:
+            self.tasks.append(asyncio.create_task(self._follow()))
+        elif self.role == "primary" and REPLICATION_LISTEN:
+            await self._serve()
+    
+    # Primary side
+    
+    async def _serve(self):
+        host, port = parse_host_port(REPLICATION_LISTEN)
+        self.server = await asyncio.start_server(self._on_standby, host, port)
+        self.tasks.append(asyncio.create_task(self.server.serve_forever()))
+        self.tasks.append(asyncio.create_task(self._heartbeat()))
+        print(f"[REPLICA] Streaming state on {host}:{port} (fence {state.fence_token})")
+    
+    async def _on_standby(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        if self.role != "primary":
+            # A deposed engine's snapshot is stale; never seed a follower with it
+            writer.close()
+            return
+        print(f"[REPLICA] Standby connected: {writer.get_extra_info('peername')}")
+        if self.last_state is None:
+            self.last_state = state.model_dump()
+            self.last_state['price_history'] = list(price_history)
+        writer.write(self._message("state", self.last_state))
+        self.writers.append(writer)
+        try:
+            # Standbys only speak to announce their promotion; returns on disconnect
+            async for line in reader:
+                msg = json.loads(line)
+                if msg.get("type") == "promoted" and msg.get("fence", 0) > state.fence_token:
+                    self.step_down(msg["fence"])
+        except (ConnectionError, OSError, ValueError):
+            pass
+        finally:
+            if writer in self.writers:
+                self.writers.remove(writer)
+            writer.close()
+            print("[REPLICA] Standby disconnected")
+    
+    async def _heartbeat(self):
+        while self.role == "primary":
+            await asyncio.sleep(REPLICATION_HEARTBEAT)
+            if self.writers:
+                self._send(self._message("hb"))
+    
+    def step_down(self, fence: int):
+        """A standby was promoted while this primary was stalled: stop serving."""
+        self.role = "deposed"
+        print("=" * 60)
+        print(f"[FAILOVER] Standby promoted with fence {fence}; this engine (fence {state.fence_token}) stepped down")
+        print("=" * 60)
+        if self.server is not None:
+            self.server.close()
+            self.server = None
+        for writer in self.writers:
+            writer.close()
+        self.writers = []
+    
+    # Standby side
+    
+    async def _follow(self):
+        host, port = parse_host_port(REPLICATION_PRIMARY)
+        while self.role == "standby":
+            try:
+                reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), REPLICATION_RECONNECT)
+            except (OSError, asyncio.TimeoutError):
+                await asyncio.sleep(REPLICATION_HEARTBEAT)
+                continue
+            
+            print(f"[REPLICA] Following primary at {host}:{port}")
+            self.upstream = writer
+            try:
+                while self.role == "standby":
+                    # Silence alone never promotes; a long one only means the connection is dead
+                    line = await asyncio.wait_for(reader.readline(), REPLICATION_RECONNECT)
+                    if self.role != "standby":
+                        break
+                    if not line:
+                        raise ConnectionError("stream closed")
+                    msg = json.loads(line)
+                    self.last_heard = time.monotonic()
+                    if msg.get("type") == "state":
+                        restore_state(dict(msg["state"]))
+                        self.last_state = msg["state"]
+                        self.has_replica = True
+                    self.seq = msg.get("seq", self.seq)
+            except (asyncio.TimeoutError, ConnectionError, OSError, ValueError) as e:
+                print(f"[REPLICA] Lost primary: {e or type(e).__name__}")
+            finally:
+                self.upstream = None
+                writer.close()
+            
+            if self.role == "standby":
+                await asyncio.sleep(REPLICATION_HEARTBEAT)
+    
+    async def accept_failover(self):
+        """
+        A tick reaching a standby means the EA gave up on the primary. Take over
+        only if the primary has been silent too; otherwise keep answering 503 and
+        the EA switches back.
+        """
+        if self.role == "standby" and self.has_replica and time.monotonic() - self.last_heard > REPLICATION_TIMEOUT:
+            await self.promote("EA failed over, primary silent")
+    
+    async def promote(self, reason: str):
+        self.role = "primary"
+        state.fence_token += 1
+        print("=" * 60)
+        print(f"[FAILOVER] Standby promoted to PRIMARY ({reason}) | Fence: {state.fence_token}")
+        print("=" * 60)
+        if self.upstream is not None:
+            # A primary that was only stalled reads this when it resumes and steps down
+            self.upstream.write(self._message("promoted"))
+            self.upstream.close()
+        save_state()
+        if REPLICATION_LISTEN:
+            await self._serve()
+
+replicator = Replicator()
+
+def standby_guard() -> Optional[JSONResponse]:
+    """Standbys (and deposed primaries) serve reads only."""
+    if replicator.role != "primary":
+        return JSONResponse(status_code=503, content={
+            "action": "WAIT", "role": replicator.role, "fence": state.fence_token
+        })
+    return None
+
 # --- Core Logic ---
 
 def get_hash(side: str) -> str:
     """Generate a unique session ID for the vector."""
     return f"{side}_{uuid.uuid4().hex[:8]}"
 
-def calculate_grid_level_price(side: str, level_index: int) -> float:
-    """Calculate the target price for a specific grid strata."""
-    rt = state.runtime
-    st = state.settings
+def next_settings_version() -> int:
+    state.settings_version += 1
+    return state.settings_version
+
+def layer_names() -> List[str]:
+    return [MAIN_LAYER, *state.layers.keys()]
+
+def layer_parts(layer: str = MAIN_LAYER) -> tuple:
+    """(settings, runtime) of a vector layer; the main layer is state.settings / state.runtime."""
+    if layer == MAIN_LAYER:
+        return state.settings, state.runtime
+    entry = state.layers[layer]
+    return entry.settings, entry.runtime
+
+def layer_of(hash_id: str) -> Optional[str]:
+    """Name of the layer currently running the vector `hash_id`."""
+    for name in layer_names():
+        _, rt = layer_parts(name)
+        if hash_id and hash_id in (rt.buy_id, rt.sell_id):
+            return name
+    return None
+
+def invalidate_levels(side: str, start: int = 0, layer: str = MAIN_LAYER):
+    """Drop cached level offsets from row position `start` onward."""
+    offsets = level_offsets.get(layer)
+    if offsets is not None:
+        del offsets[side][start:]
+
+def refresh_grid_scale():
+    """
+    Recompute each layer's volatility gap factor. Level prices and trigger
+    thresholds only move when a factor drifts past VOL_SCALE_TOLERANCE.
+    """
+    for layer in layer_names():
+        st, _ = layer_parts(layer)
+        current = grid_scale.get(layer, 1.0)
+        
+        if (st.grid_mode != "volatility" or st.vol_reference_atr <= 0 or st.vol_scale_min <= 0
+                or volatility.count < VOL_WARMUP):
+            factor = 1.0
+        else:
+            factor = min(max(volatility.atr / st.vol_reference_atr, st.vol_scale_min), st.vol_scale_max)
+            if current > 0 and abs(factor - current) / current < VOL_SCALE_TOLERANCE:
+                continue
+        
+        if factor != current:
+            grid_scale[layer] = factor
+            mark_state_changed()
+
+def side_fields(side: str, layer: str = MAIN_LAYER) -> tuple:
+    st, _ = layer_parts(layer)
+    return tuple(getattr(st, f"{side}_{f}") for f in ("limit_price", "tp_type", "tp_value", "hedge_value"))
+
+def install_rows(side: str, new_rows: List[GridRow], layer: str = MAIN_LAYER):
+    """
+    Replace a side's strata, stamping changed rows with a new settings version
+    and invalidating level offsets only from the first row whose gap moved.
+    """
+    st, _ = layer_parts(layer)
+    old_rows = st.rows_buy if side == "buy" else st.rows_sell
+    old_by_index = {r.index: r for r in old_rows}
+    stamp = None
+    
+    for row in new_rows:
+        old = old_by_index.get(row.index)
+        if old is not None and (old.dollar, old.lots, old.alert) == (row.dollar, row.lots, row.alert):
+            row.version = old.version
+        else:
+            if stamp is None:
+                stamp = next_settings_version()
+            row.version = stamp
+    
+    first_moved = min(len(old_rows), len(new_rows))
+    for i, (a, b) in enumerate(zip(old_rows, new_rows)):
+        if a.dollar != b.dollar:
+            first_moved = i
+            break
+    invalidate_levels(side, first_moved, layer)
     
     if side == "buy":
-        ref = rt.buy_start_ref
-        for i in range(level_index + 1):
-            if i < len(st.rows_buy):
-                ref -= st.rows_buy[i].dollar
-        return ref
+        st.rows_buy = new_rows
     else:
-        ref = rt.sell_start_ref
-        for i in range(level_index + 1):
-            if i < len(st.rows_sell):
-                ref += st.rows_sell[i].dollar
-        return ref
-
-def update_exec_stats(tick: TickData):
-    """Update internal execution map based on broker positions."""
-    rt = state.runtime
+        st.rows_sell = new_rows
+
+def calculate_grid_level_price(side: str, level_index: int, layer: str = MAIN_LAYER) -> float:
+    """
+    Calculate the target price for a specific grid strata. Executed strata keep
+    the gap factor they were filled at; only the gaps still ahead are scaled by
+    the current volatility factor.
+    """
+    st, rt = layer_parts(layer)
+    rows = st.rows_buy if side == "buy" else st.rows_sell
+    exec_map = rt.buy_exec_map if side == "buy" else rt.sell_exec_map
+    offsets = level_offsets.setdefault(layer, {"buy": [], "sell": []})[side]
     
-    # Start with a copy to preserve history of closed trades during the session
-    buy_map = rt.buy_exec_map.copy()
-    sell_map = rt.sell_exec_map.copy()
+    # A new factor rescales the unexecuted gaps; fills and resets move that boundary
+    factor = grid_scale.get(layer, 1.0)
+    basis = level_basis.setdefault(layer, {}).get(side)
+    if basis != (factor, len(exec_map)):
+        if basis is not None:
+            del offsets[min(basis[1], len(exec_map)):]
+        level_basis[layer][side] = (factor, len(exec_map))
     
-    for p in tick.positions:
-        if not TRADE_ID_PATTERN.match(p.comment):
-            continue 
-
-        # Check for Session Conflict
-        if "buy_" in p.comment:
-            if not rt.buy_id or rt.buy_id not in p.comment:
-                rt.error_status = f"CRITICAL: Identity Conflict. Unknown Buy trade {p.ticket} detected."
-                return
-
-        if "sell_" in p.comment:
-            if not rt.sell_id or rt.sell_id not in p.comment:
-                rt.error_status = f"CRITICAL: Identity Conflict. Unknown Sell trade {p.ticket} detected."
-                return
+    # Extend the prefix-sum table for rows changed since the last call
+    last = min(level_index, len(rows) - 1)
+    while len(offsets) <= last:
+        executed = exec_map.get(str(len(offsets)))
+        scale = executed.gap_scale if executed is not None else factor
+        prev = offsets[-1] if offsets else 0.0
+        offsets.append(prev + rows[len(offsets)].dollar * scale)
+    
+    offset = offsets[last] if last >= 0 else 0.0
+    
+    if side == "buy":
+        return rt.buy_start_ref - offset
+    else:
+        return rt.sell_start_ref + offset
 
+def update_exec_stats():
+    """Update the execution maps of every layer from positions changed in the book."""
+    rt = state.runtime
+    
+    # Vector hash -> (layer, side) for every running vector
+    owners = {}
+    for layer in layer_names():
+        _, lrt = layer_parts(layer)
+        for side in ("buy", "sell"):
+            hash_id = getattr(lrt, f"{side}_id")
+            if hash_id:
+                owners[hash_id] = (layer, side)
+    
+    # Check for Session Conflict (one lookup per managed vector in the book)
+    for hash_id, group in position_book.vectors.items():
+        if hash_id not in owners:
+            kind = "Buy" if hash_id.startswith("buy_") else "Sell"
+            rt.error_status = f"CRITICAL: Identity Conflict. Unknown {kind} trade {next(iter(group))} detected."
+            return
+    
+    changed = position_book.drain_changes()
+    if not changed:
+        return
+    
+    # Start with copies to preserve history of closed trades during the session
+    maps = {}
+    for layer in layer_names():
+        _, lrt = layer_parts(layer)
+        maps[(layer, "buy")] = lrt.buy_exec_map.copy()
+        maps[(layer, "sell")] = lrt.sell_exec_map.copy()
+    
+    # Single pass over the changed positions, routed to their owning vector
+    for p in changed:
+        owner = owners.get(position_book.vector_of(p))
+        if owner is None or p.type != owner[1].upper():
+            continue
         try:
-            if p.type == "BUY" and rt.buy_id in p.comment:
-                parts = p.comment.split("_idx")
-                if len(parts) == 2:
-                    idx = int(parts[1])
-                    buy_map[str(idx)] = RowExecStats(
-                        index=idx, entry_price=p.price, lots=p.volume,
-                        profit=p.profit, timestamp=datetime.now().isoformat()
-                    )
-            
-            if p.type == "SELL" and rt.sell_id in p.comment:
-                parts = p.comment.split("_idx")
-                if len(parts) == 2:
-                    idx = int(parts[1])
-                    sell_map[str(idx)] = RowExecStats(
-                        index=idx, entry_price=p.price, lots=p.volume,
-                        profit=p.profit, timestamp=datetime.now().isoformat()
-                    )
+            idx = int(p.comment.split("_idx")[1])
+            known = maps[owner].get(str(idx))
+            maps[owner][str(idx)] = RowExecStats(
+                index=idx, entry_price=p.price, lots=p.volume,
+                profit=p.profit, timestamp=datetime.now().isoformat(),
+                gap_scale=known.gap_scale if known is not None else grid_scale.get(owner[0], 1.0)
+            )
         except Exception:
             pass
 
     # Calculate cumulatives (Basket Stats)
-    for map_dict in [buy_map, sell_map]:
+    for (layer, side), map_dict in maps.items():
         indices = sorted([int(k) for k in map_dict.keys()])
         cum_lots, cum_profit = 0.0, 0.0
         for idx in indices:
             row = map_dict[str(idx)]
             cum_lots += row.lots
             cum_profit += row.profit
-            row.cumulative_lots = cum_lots
-            row.cumulative_profit = cum_profit
-    
-    rt.buy_exec_map = buy_map
-    rt.sell_exec_map = sell_map
+            if (row.cumulative_lots, row.cumulative_profit) != (cum_lots, cum_profit):
+                # Replace rather than edit: detached UI snapshots may share the old object
+                map_dict[str(idx)] = row.model_copy(update={"cumulative_lots": cum_lots, "cumulative_profit": cum_profit})
+        
+        _, lrt = layer_parts(layer)
+        if len(map_dict) != len(getattr(lrt, f"{side}_exec_map")):
+            mark_state_changed()
+        setattr(lrt, f"{side}_exec_map", map_dict)
+
+def calculate_tp_target(tp_type: str, tp_value: float, tick: TickData) -> float:
+    """Basket profit (money) at which the Snap-Back TP fires."""
+    if tp_type == "equity_pct":
+        return tick.equity * (tp_value / 100.0)
+    elif tp_type == "balance_pct":
+        return tick.balance * (tp_value / 100.0)
+    elif tp_type == "fixed_money":
+        return tp_value
+    return 0.0
 
-def check_tp_buy(tick: TickData) -> int:
+def check_tp_buy(tick: TickData, layer: str = MAIN_LAYER) -> int:
     """Check if BUY side 'Snap-Back' profit target is reached."""
-    st = state.settings
-    rt = state.runtime
+    st, rt = layer_parts(layer)
     
     if st.buy_tp_value <= 0 or not rt.buy_id:
         return -1
     
-    buy_positions = [p for p in tick.positions if rt.buy_id in p.comment]
-    
-    if not buy_positions:
+    if position_book.count(rt.buy_id) == 0:
         return 0
     
-    profit = sum(p.profit for p in buy_positions)
+    profit = position_book.profit(rt.buy_id)
     
-    target = 0.0
-    if st.buy_tp_type == "equity_pct":
-        target = tick.equity * (st.buy_tp_value / 100.0)
-    elif st.buy_tp_type == "balance_pct":
-        target = tick.balance * (st.buy_tp_value / 100.0)
-    elif st.buy_tp_type == "fixed_money":
-        target = st.buy_tp_value
+    target = calculate_tp_target(st.buy_tp_type, st.buy_tp_value, tick)
     
     if target > 0 and profit >= target:
         print(f"[ELASTIC SNAP-BACK] Buy Basket Profit: ${profit:.2f} >= Target: ${target:.2f}")
@@ -272,28 +1192,19 @@ def check_tp_buy(tick: TickData) -> int:
         
     return 0
 
-def check_tp_sell(tick: TickData) -> int:
+def check_tp_sell(tick: TickData, layer: str = MAIN_LAYER) -> int:
     """Check if SELL side 'Snap-Back' profit target is reached."""
-    st = state.settings
-    rt = state.runtime
+    st, rt = layer_parts(layer)
     
     if st.sell_tp_value <= 0 or not rt.sell_id:
         return -1
     
-    sell_positions = [p for p in tick.positions if rt.sell_id in p.comment]
-    
-    if not sell_positions:
+    if position_book.count(rt.sell_id) == 0:
         return 0
     
-    profit = sum(p.profit for p in sell_positions)
+    profit = position_book.profit(rt.sell_id)
     
-    target = 0.0
-    if st.sell_tp_type == "equity_pct":
-        target = tick.equity * (st.sell_tp_value / 100.0)
-    elif st.sell_tp_type == "balance_pct":
-        target = tick.balance * (st.sell_tp_value / 100.0)
-    elif st.sell_tp_type == "fixed_money":
-        target = st.sell_tp_value
+    target = calculate_tp_target(st.sell_tp_type, st.sell_tp_value, tick)
     
     if target > 0 and profit >= target:
         print(f"[ELASTIC SNAP-BACK] Sell Basket Profit: ${profit:.2f} >= Target: ${target:.2f}")
@@ -301,13 +1212,28 @@ def check_tp_sell(tick: TickData) -> int:
         
     return 0
 
-def count_active_trades(tick: TickData, hash_id: str) -> int:
-    if not hash_id: return 0
-    return sum(1 for p in tick.positions if hash_id in p.comment)
+def count_active_trades(hash_id: str) -> int:
+    return position_book.count(hash_id)
+
+def ingest_positions(tick: TickData) -> bool:
+    """Apply the tick's position payload to the book. False = resync needed."""
+    if tick.protocol < 2 or tick.full:
+        position_book.sync(tick.positions, tick.bid, tick.ask)
+    elif position_book.synced:
+        position_book.apply(tick.upserts, tick.closed, tick.bid, tick.ask)
+    else:
+        return False
+    
+    if tick.book_count is not None:
+        if not position_book.matches(tick.book_count, tick.book_ticket_sum or 0):
+            print(f"[BOOK] Checksum mismatch ({tick.book_count} vs {len(position_book.positions)}). Requesting resync.")
+            position_book.synced = False
+            return False
+    return True
 
-def get_last_executed_price(side: str) -> float:
+def get_last_executed_price(side: str, layer: str = MAIN_LAYER) -> float:
     """Get the price of the last executed strata."""
-    rt = state.runtime
+    _, rt = layer_parts(layer)
     
     if side == "buy":
         if not rt.buy_exec_map:
@@ -322,546 +1248,1030 @@ def get_last_executed_price(side: str) -> float:
         last_idx = indices[-1]
         return rt.sell_exec_map[str(last_idx)].entry_price
 
-# --- FastAPI App ---
-
-app = FastAPI(title="Elastic DCA Engine", version="3.4.2")
-
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
-@app.exception_handler(RequestValidationError)
-async def validation_handler(request: Request, exc: RequestValidationError):
-    print("=" * 80)
-    print("[VALIDATION ERROR]")
-    body = await request.body()
-    print(f"Body: {body.decode('utf-8')[:500]}")
-    print(f"Errors: {exc.errors()}")
-    print("=" * 80)
-    return JSONResponse(status_code=422, content={"detail": exc.errors()})
-
-@app.on_event("startup")
-async def startup():
-    print("=" * 60)
-    print("Elastic DCA Engine v3.4.2")
-    print("Status: ONLINE | IronClad Protection: READY")
-    print("=" * 60)
-    load_state()
-
-@app.get("/")
-async def root():
-    return {"status": "running", "system": "Elastic DCA Engine", "version": "3.4.2"}
+# --- Trigger Fast Path ---
 
-@app.post("/api/tick")
-async def handle_tick(request: Request):
-    try:
-        # Raw Body Parsing
-        body_bytes = await request.body()
-        body_str = body_bytes.decode('utf-8', errors='ignore')
-        body_str = body_str.rstrip('\x00').strip()
-        last_brace = body_str.rfind('}')
-        if last_brace != -1:
-            body_str = body_str[:last_brace + 1]
-        
-        try:
-            tick_data = json.loads(body_str)
-            tick = TickData(**tick_data)
-        except json.JSONDecodeError as e:
-            print(f"[ERROR] JSON Parse: {e}")
-            return {"action": "WAIT"}
+def compute_trigger_levels(layer: str = MAIN_LAYER) -> Optional[Dict[str, dict]]:
+    """
+    Precompute, per side, the levels at which the next tick could change state:
+    strata/anchor price, Snap-Back TP and IronClad hedge floor.
+    Returns None while the layer is in a phase that must always run the full pipeline.
+    """
+    st, rt = layer_parts(layer)
+    
+    if state.runtime.error_status or rt.pending_actions:
+        return None
+    
+    levels = {}
+    # An invalid next buy row ends the pipeline with WAIT before the sell expansion
+    buy_stalled = False
+    for side in ("buy", "sell"):
+        hash_id = getattr(rt, f"{side}_id")
+        is_on = getattr(rt, f"{side}_on")
+        exec_map = getattr(rt, f"{side}_exec_map")
+        rows = getattr(st, f"rows_{side}")
         
-        rt = state.runtime
-        st = state.settings
-        now_ts = time.time()
+        hedge_triggered = getattr(rt, f"{side}_hedge_triggered")
         
-        # Conflict Block
-        if rt.error_status:
-            print(f"[BLOCKED] Engine Locked: {rt.error_status}")
-            return {"action": "WAIT", "error": rt.error_status}
-
-        # Market Data Update
-        mid = (tick.ask + tick.bid) / 2
-        rt.current_ask = tick.ask
-        rt.current_bid = tick.bid
+        # Closing confirmation acts on the next tick
+        if getattr(rt, f"{side}_is_closing"):
+            return None
         
-        if price_history:
-            rt.price_direction = "up" if mid > price_history[-1]['mid'] else "down"
+        expanding = not (side == "sell" and buy_stalled)
+        # Vector initialization acts on the next tick
+        if expanding and is_on and not hash_id and not hedge_triggered:
+            return None
         
-        price_history.append({"mid": mid, "ts": now_ts})
-        rt.current_price = mid
-        state.last_update_ts = datetime.now().isoformat()
+        armed = is_on and hash_id and not hedge_triggered
+        price = None
+        if armed and expanding:
+            if getattr(rt, f"{side}_waiting_limit"):
+                price = getattr(st, f"{side}_limit_price")
+            elif len(exec_map) < len(rows):
+                row = rows[len(exec_map)]
+                if row.dollar > 0 and row.lots > 0:
+                    price = calculate_grid_level_price(side, len(exec_map), layer)
+                elif side == "buy":
+                    buy_stalled = True
         
-        # Update Stats
-        update_exec_stats(tick)
-        if rt.error_status:
-             return {"action": "WAIT", "error": rt.error_status}
+        hedge_value = getattr(st, f"{side}_hedge_value")
+        levels[side] = {
+            "id": hash_id,
+            "price": price,
+            "tp_type": getattr(st, f"{side}_tp_type"),
+            "tp_value": getattr(st, f"{side}_tp_value") if hash_id else 0.0,
+            "hedge_floor": -hedge_value if (armed and hedge_value > 0) else None,
+            # External close detection needs the full pipeline once the basket empties
+            "track_close": bool(hash_id and exec_map),
+        }
+    return levels
 
-        # Priority 1: Pending Actions (Manual Overrides)
-        if rt.pending_actions:
-            action = rt.pending_actions.pop(0)
-            save_state()
-            cmt = "server"
-            if "BUY" in action: cmt = rt.buy_id
-            elif "SELL" in action: cmt = rt.sell_id
-            return {"action": "CLOSE_ALL", "comment": cmt}
-        
-        # --- PRIORITY 1.5: Closing Confirmation Monitor ---
-        
-        # Check Buy Closing Phase
-        if rt.buy_is_closing:
-            count = count_active_trades(tick, rt.buy_id)
-            if count == 0:
-                print(f"[CONFIRMED] Buy Vector Closed. Resetting Session.")
-                rt.buy_is_closing = False
-                rt.buy_exec_map = {}
-                rt.buy_hedge_triggered = False
-                
-                if rt.cyclic_on:
-                    rt.buy_id = ""
-                    rt.buy_start_ref = mid
-                else:
-                    rt.buy_on = False
-                    rt.buy_id = ""
-                    rt.buy_start_ref = 0.0
-                save_state()
-                return {"action": "WAIT"}
-            else:
-                return {"action": "CLOSE_ALL", "comment": rt.buy_id}
-
-        # Check Sell Closing Phase
-        if rt.sell_is_closing:
-            count = count_active_trades(tick, rt.sell_id)
-            if count == 0:
-                print(f"[CONFIRMED] Sell Vector Closed. Resetting Session.")
-                rt.sell_is_closing = False
-                rt.sell_exec_map = {}
-                rt.sell_hedge_triggered = False
-                
-                if rt.cyclic_on:
-                    rt.sell_id = ""
-                    rt.sell_start_ref = mid
-                else:
-                    rt.sell_on = False
-                    rt.sell_id = ""
-                    rt.sell_start_ref = 0.0
-                save_state()
-                return {"action": "WAIT"}
-            else:
-                return {"action": "CLOSE_ALL", "comment": rt.sell_id}
+def get_trigger_levels() -> Optional[List[tuple]]:
+    """(side, levels) of every vector across all layers; None if any layer needs the full pipeline."""
+    if trigger_cache["epoch"] != state_epoch:
+        vectors = []
+        for layer in layer_names():
+            levels = compute_trigger_levels(layer)
+            if levels is None:
+                vectors = None
+                break
+            vectors.extend(levels.items())
+        trigger_cache["levels"] = vectors
+        trigger_cache["epoch"] = state_epoch
+    return trigger_cache["levels"]
 
-        # --- PRIORITY 1.8: HEDGE MONITOR (IronClad Protocol) ---
+def tick_is_quiet(tick: TickData) -> bool:
+    """True if this tick cannot cross any trigger, i.e. the answer is WAIT."""
+    if position_book.membership_changed:
+        return False
+    
+    levels = get_trigger_levels()
+    if levels is None:
+        return False
+    
+    for side, lv in levels:
+        if lv["price"] is not None:
+            if side == "buy" and tick.ask <= lv["price"]:
+                return False
+            if side == "sell" and tick.bid >= lv["price"]:
+                return False
         
-        # BUY SIDE HEDGE CHECK
-        if (rt.buy_on and rt.buy_id and not rt.buy_hedge_triggered and 
-            st.buy_hedge_value > 0 and not rt.buy_is_closing):
-            
-            buy_positions = [p for p in tick.positions if rt.buy_id in p.comment]
-            if buy_positions:
-                total_buy_profit = sum(p.profit for p in buy_positions)
-                loss_threshold = -1 * st.buy_hedge_value
-                
-                if total_buy_profit <= loss_threshold:
-                    print(f"[IRONCLAD ALERT] Buy Drawdown: ${total_buy_profit:.2f} <= Limit: ${loss_threshold:.2f}")
-                    
-                    # Lock the losing side
-                    rt.buy_hedge_triggered = True
-                    
-                    # Calculate total hedge volume
-                    hedge_lots = sum(p.volume for p in buy_positions)
-                    print(f"[HEDGE] Deploying Counter-Measure: {hedge_lots} lots SELL")
-                    
-                    # Check if opposite side is ready (not closing)
-                    if not rt.sell_is_closing:
-                        # Scenario A: Sell Side is OFF or Empty
-                        if not rt.sell_on or not rt.sell_id or len(rt.sell_exec_map) == 0:
-                            print(f"[HEDGE] Initializing Emergency Sell Session")
-                            
-                            # Force start Sell Session
-                            rt.sell_id = get_hash("sell")
-                            rt.sell_start_ref = tick.bid
-                            rt.sell_exec_map = {}
-                            rt.sell_on = True
-                            rt.sell_waiting_limit = False
-                            
-                            # Clear and inject hedge row
-                            st.rows_sell = [GridRow(index=0, dollar=0.0, lots=hedge_lots, alert=True)]
-                            
-                            save_state()
-                            
-                            # Execute immediately
-                            rt.sell_exec_map["0"] = RowExecStats(
-                                index=0,
-                                entry_price=tick.bid,
-                                lots=hedge_lots,
-                                profit=0,
-                                timestamp=datetime.now().isoformat()
-                            )
-                            rt.sell_last_order_sent_ts = now_ts
-                            save_state()
-                            
-                            return {
-                                "action": "SELL",
-                                "volume": hedge_lots,
-                                "comment": f"{rt.sell_id}_idx0",
-                                "alert": True
-                            }
-                        
-                        # Scenario B: Sell Side is Already Running
-                        else:
-                            print(f"[HEDGE] Augmenting Existing Sell Session")
-                            
-                            # Get last executed index
-                            indices = sorted([int(k) for k in rt.sell_exec_map.keys()])
-                            last_idx = indices[-1] if indices else -1
-                            new_idx = last_idx + 1
-                            
-                            # Get price of last level
-                            last_price = get_last_executed_price("sell")
-                            
-                            # Calculate dynamic gap to current market
-                            new_dollar_gap = abs(tick.bid - last_price)
-                            
-                            # Inject new row
-                            new_row = GridRow(index=new_idx, dollar=new_dollar_gap, lots=hedge_lots, alert=True)
-                            st.rows_sell.append(new_row)
-                            
-                            save_state()
-                            
-                            # Execute immediately (gap designed to match current bid)
-                            rt.sell_exec_map[str(new_idx)] = RowExecStats(
-                                index=new_idx,
-                                entry_price=tick.bid,
-                                lots=hedge_lots,
-                                profit=0,
-                                timestamp=datetime.now().isoformat()
-                            )
-                            rt.sell_last_order_sent_ts = now_ts
-                            save_state()
-                            
-                            return {
-                                "action": "SELL",
-                                "volume": hedge_lots,
-                                "comment": f"{rt.sell_id}_idx{new_idx}",
-                                "alert": True
-                            }
-        
-        # SELL SIDE HEDGE CHECK
-        if (rt.sell_on and rt.sell_id and not rt.sell_hedge_triggered and 
-            st.sell_hedge_value > 0 and not rt.sell_is_closing):
-            
-            sell_positions = [p for p in tick.positions if rt.sell_id in p.comment]
-            if sell_positions:
-                total_sell_profit = sum(p.profit for p in sell_positions)
-                loss_threshold = -1 * st.sell_hedge_value
-                
-                if total_sell_profit <= loss_threshold:
-                    print(f"[IRONCLAD ALERT] Sell Drawdown: ${total_sell_profit:.2f} <= Limit: ${loss_threshold:.2f}")
-                    
-                    # Lock the losing side
-                    rt.sell_hedge_triggered = True
-                    
-                    # Calculate total hedge volume
-                    hedge_lots = sum(p.volume for p in sell_positions)
-                    print(f"[HEDGE] Deploying Counter-Measure: {hedge_lots} lots BUY")
-                    
-                    # Check if opposite side is ready (not closing)
-                    if not rt.buy_is_closing:
-                        # Scenario A: Buy Side is OFF or Empty
-                        if not rt.buy_on or not rt.buy_id or len(rt.buy_exec_map) == 0:
-                            print(f"[HEDGE] Initializing Emergency Buy Session")
-                            
-                            # Force start Buy Session
-                            rt.buy_id = get_hash("buy")
-                            rt.buy_start_ref = tick.ask
-                            rt.buy_exec_map = {}
-                            rt.buy_on = True
-                            rt.buy_waiting_limit = False
-                            
-                            # Clear and inject hedge row
-                            st.rows_buy = [GridRow(index=0, dollar=0.0, lots=hedge_lots, alert=True)]
-                            
-                            save_state()
-                            
-                            # Execute immediately
-                            rt.buy_exec_map["0"] = RowExecStats(
-                                index=0,
-                                entry_price=tick.ask,
-                                lots=hedge_lots,
-                                profit=0,
-                                timestamp=datetime.now().isoformat()
-                            )
-                            rt.buy_last_order_sent_ts = now_ts
-                            save_state()
-                            
-                            return {
-                                "action": "BUY",
-                                "volume": hedge_lots,
-                                "comment": f"{rt.buy_id}_idx0",
-                                "alert": True
-                            }
-                        
-                        # Scenario B: Buy Side is Already Running
-                        else:
-                            print(f"[HEDGE] Augmenting Existing Buy Session")
-                            
-                            # Get last executed index
-                            indices = sorted([int(k) for k in rt.buy_exec_map.keys()])
-                            last_idx = indices[-1] if indices else -1
-                            new_idx = last_idx + 1
-                            
-                            # Get price of last level
-                            last_price = get_last_executed_price("buy")
-                            
-                            # Calculate dynamic gap to current market
-                            new_dollar_gap = abs(tick.ask - last_price)
-                            
-                            # Inject new row
-                            new_row = GridRow(index=new_idx, dollar=new_dollar_gap, lots=hedge_lots, alert=True)
-                            st.rows_buy.append(new_row)
-                            
-                            save_state()
-                            
-                            # Execute immediately (gap designed to match current ask)
-                            rt.buy_exec_map[str(new_idx)] = RowExecStats(
-                                index=new_idx,
-                                entry_price=tick.ask,
-                                lots=hedge_lots,
-                                profit=0,
-                                timestamp=datetime.now().isoformat()
-                            )
-                            rt.buy_last_order_sent_ts = now_ts
-                            save_state()
-                            
-                            return {
-                                "action": "BUY",
-                                "volume": hedge_lots,
-                                "comment": f"{rt.buy_id}_idx{new_idx}",
-                                "alert": True
-                            }
-
-        # Priority 2: TP Logic - Check Buy Side
-        if rt.buy_id:
-            tp_result = check_tp_buy(tick)
-            if tp_result == 1:
-                rt.buy_is_closing = True
-                print("[BUY SNAP-BACK] Profit Target Reached. Closing Vector...")
-                save_state()
-                return {"action": "CLOSE_ALL", "comment": rt.buy_id}
+        count = position_book.count(lv["id"])
+        if lv["track_close"] and count == 0:
+            return False
+        if count:
+            profit = position_book.profit(lv["id"])
+            if lv["hedge_floor"] is not None and profit <= lv["hedge_floor"]:
+                return False
+            if lv["tp_value"] > 0:
+                target = calculate_tp_target(lv["tp_type"], lv["tp_value"], tick)
+                if target > 0 and profit >= target:
+                    return False
+    return True
 
-        # Priority 2: TP Logic - Check Sell Side
-        if rt.sell_id:
-            tp_result = check_tp_sell(tick)
-            if tp_result == 1:
-                rt.sell_is_closing = True
-                print("[SELL SNAP-BACK] Profit Target Reached. Closing Vector...")
-                save_state()
-                return {"action": "CLOSE_ALL", "comment": rt.sell_id}
+# --- Poll Interval Hints ---
 
-        # Priority 3: External Close (Manual Close Detection) - WITH GRACE PERIOD
+def trigger_distance(tick: TickData, levels: List[tuple]) -> Optional[float]:
+    """Price distance to the nearest strata, limit, TP or hedge threshold (None = nothing armed)."""
+    nearest = None
+    for side, lv in levels:
+        gaps = []
+        if lv["price"] is not None:
+            gaps.append(tick.ask - lv["price"] if side == "buy" else lv["price"] - tick.bid)
         
-        # Buy Side - Only check if grace period has passed
-        buy_grace_passed = (now_ts - rt.buy_last_order_sent_ts) >= EXTERNAL_CLOSE_GRACE_PERIOD
+        count = position_book.count(lv["id"])
+        if lv["track_close"] and count == 0:
+            return 0.0
+        if count:
+            profit = position_book.profit(lv["id"])
+            money = []
+            if lv["hedge_floor"] is not None:
+                money.append(profit - lv["hedge_floor"])
+            if lv["tp_value"] > 0:
+                target = calculate_tp_target(lv["tp_type"], lv["tp_value"], tick)
+                if target > 0:
+                    money.append(target - profit)
+            if money:
+                per_point = position_book.per_point(lv["id"])
+                gaps += [m / per_point if per_point > 0 else 0.0 for m in money]
         
-        if (rt.buy_id and len(rt.buy_exec_map) > 0 and not rt.buy_is_closing and buy_grace_passed):
-            mt5_count = count_active_trades(tick, rt.buy_id)
-            
-            if mt5_count == 0:
-                print(f"[EXTERNAL CLOSE] Buy Session Manually Terminated.")
-                if rt.cyclic_on:
-                    rt.buy_id = ""
-                    rt.buy_exec_map = {}
-                    rt.buy_start_ref = mid
-                    rt.buy_hedge_triggered = False
-                else:
-                    rt.buy_on = False
-                    rt.buy_id = ""
-                    rt.buy_exec_map = {}
-                    rt.buy_hedge_triggered = False
-                save_state()
+        for gap in gaps:
+            nearest = gap if nearest is None else min(nearest, gap)
+    return nearest
 
-        # Sell Side - Only check if grace period has passed
-        sell_grace_passed = (now_ts - rt.sell_last_order_sent_ts) >= EXTERNAL_CLOSE_GRACE_PERIOD
-        
-        if (rt.sell_id and len(rt.sell_exec_map) > 0 and not rt.sell_is_closing and sell_grace_passed):
-            mt5_count = count_active_trades(tick, rt.sell_id)
-            
-            if mt5_count == 0:
-                print(f"[EXTERNAL CLOSE] Sell Session Manually Terminated.")
-                if rt.cyclic_on:
-                    rt.sell_id = ""
-                    rt.sell_exec_map = {}
-                    rt.sell_start_ref = mid
-                    rt.sell_hedge_triggered = False
-                else:
-                    rt.sell_on = False
-                    rt.sell_id = ""
-                    rt.sell_exec_map = {}
-                    rt.sell_hedge_triggered = False
-                save_state()
-        
-        # Priority 4: Elastic Grid Expansion - BUY (Accumulation Phase)
-        if rt.buy_on and not rt.buy_is_closing and not rt.buy_hedge_triggered:
-            if not rt.buy_id:
-                rt.buy_id = get_hash("buy")
-                rt.buy_exec_map = {}
-                rt.buy_start_ref = st.buy_limit_price if st.buy_limit_price > 0 else tick.ask
-                rt.buy_waiting_limit = st.buy_limit_price > 0
-                print(f"[ELASTIC START] Buy Vector Initiated: {rt.buy_id} | Anchor: {rt.buy_start_ref}")
-                save_state()
-            
-            if rt.buy_waiting_limit:
-                if tick.ask <= st.buy_limit_price:
-                    rt.buy_waiting_limit = False
-                    rt.buy_start_ref = tick.ask
-                    print(f"[LIMIT TRIGGER] Buy Anchor Set at {rt.buy_start_ref}")
-                    save_state()
-            else:
-                idx = len(rt.buy_exec_map)
-                if idx < len(st.rows_buy):
-                    row = st.rows_buy[idx]
-                    if row.dollar <= 0 or row.lots <= 0:
-                        return {"action": "WAIT"} 
-                    target = calculate_grid_level_price("buy", idx)
-                    if tick.ask <= target:
-                        rt.buy_exec_map[str(idx)] = RowExecStats(
-                            index=idx, 
-                            entry_price=tick.ask, 
-                            lots=row.lots,
-                            profit=0, 
-                            timestamp=datetime.now().isoformat()
-                        )
-                        rt.buy_last_order_sent_ts = now_ts
-                        print(f"[GRID EXPANSION] Buy Strata {idx} Reached: {target}")
-                        save_state()
-                        return {
-                            "action": "BUY",
-                            "volume": row.lots,
-                            "comment": f"{rt.buy_id}_idx{idx}",
-                            "alert": row.alert
-                        }
-        
-        # Priority 5: Elastic Grid Expansion - SELL (Accumulation Phase)
-        if rt.sell_on and not rt.sell_is_closing and not rt.sell_hedge_triggered:
-            if not rt.sell_id:
-                rt.sell_id = get_hash("sell")
-                rt.sell_exec_map = {}
-                rt.sell_start_ref = st.sell_limit_price if st.sell_limit_price > 0 else tick.bid
-                rt.sell_waiting_limit = st.sell_limit_price > 0
-                print(f"[ELASTIC START] Sell Vector Initiated: {rt.sell_id} | Anchor: {rt.sell_start_ref}")
-                save_state()
+def recommend_poll_ms(tick: TickData, response: dict) -> int:
+    """
+    Suggested delay before the next tick. The mid is treated as a random walk,
+    so the expected time for a POLL_SIGMA move to cover the distance d is
+    (d / (POLL_SIGMA * sigma))^2 with sigma the per-second volatility (the
+    time-normalised ATR, independent of the poll rate it feeds back into).
+    """
+    if response.get("action", "WAIT") != "WAIT" or response.get("resync") or position_book.membership_changed:
+        return POLL_MIN_MS
+    if response.get("error"):
+        return POLL_DEFAULT_MS
+    
+    levels = get_trigger_levels()
+    if levels is None:
+        # Closing, initializing or pending manual actions: resolve quickly
+        return POLL_MIN_MS
+    
+    distance = trigger_distance(tick, levels)
+    if distance is None:
+        return POLL_MAX_MS
+    if distance <= 0:
+        return POLL_MIN_MS
+    if volatility.count < VOL_WARMUP:
+        return POLL_DEFAULT_MS
+    
+    sigma = volatility.atr  # price units per sqrt(second)
+    if sigma <= 0:
+        return POLL_DEFAULT_MS
+    seconds = POLL_SAFETY * (distance / (POLL_SIGMA * sigma)) ** 2
+    return int(min(max(seconds * 1000.0, POLL_MIN_MS), POLL_MAX_MS))
+
+# --- Profiling (Admin) ---
+
+short_paths: Dict[str, str] = {}
+
+def frame_label(code) -> str:
+    """"func (dir/file.py:line)": the parent directory keeps e.g. pydantic/main.py apart from ours."""
+    path = short_paths.get(code.co_filename)
+    if path is None:
+        head, tail = os.path.split(code.co_filename)
+        path = short_paths[code.co_filename] = f"{os.path.basename(head)}/{tail}" if head else tail
+    return f"{code.co_name} ({path}:{code.co_firstlineno})"
+
+def collapse(counts: Counter) -> str:
+    """Collapsed-stack text ("root;child;leaf weight" per line), as consumed by flamegraph tools."""
+    return "\n".join(f"{stack} {int(weight)}" for stack, weight in counts.most_common() if int(weight) > 0)
+
+def top_frames(counts: Counter, limit: int = 25) -> List[dict]:
+    """Leaf (self) weight per function, heaviest first."""
+    leaves = Counter()
+    for stack, weight in counts.items():
+        leaves[stack.rsplit(";", 1)[-1]] += weight
+    total = sum(leaves.values()) or 1
+    return [{"frame": f, "weight": int(w), "share": w / total} for f, w in leaves.most_common(limit)]
+
+def sample_stacks(seconds: float, interval: float, all_threads: bool) -> tuple:
+    """Wall-clock sampler: snapshot every thread's stack via sys._current_frames()."""
+    me = threading.get_ident()
+    engine_file = os.path.abspath(__file__)
+    counts = Counter()
+    samples = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        names = {t.ident: t.name for t in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == me:
+                continue
+            stack = []
+            ours = all_threads
+            while frame is not None:
+                code = frame.f_code
+                stack.append(frame_label(code))
+                # Module-level code (the uvicorn.run call) does not count as engine work
+                ours = ours or (code.co_filename == engine_file and code.co_name != "<module>")
+                frame = frame.f_back
+            if ours:
+                stack.append(names.get(ident, str(ident)))
+                counts[";".join(reversed(stack))] += 1
+        samples += 1
+        time.sleep(interval)
+    return counts, samples
+
+class CallTracer:
+    """
+    sys.setprofile hook for one tick: charges the time between profiler events
+    (microseconds) to the current call path, so each path gets its self time.
+    """
+    
+    def __init__(self, root: str, counts: Counter):
+        self.paths = [root]
+        self.counts = counts
+        self.last = time.perf_counter()
+    
+    def __call__(self, frame, event, arg):
+        now = time.perf_counter()
+        self.counts[self.paths[-1]] += (now - self.last) * 1e6
+        if event == "call":
+            self.paths.append(f"{self.paths[-1]};{frame_label(frame.f_code)}")
+        elif event == "c_call":
+            name = f"{getattr(arg, '__qualname__', None) or getattr(arg, '__name__', '?')} (builtin)"
+            self.paths.append(f"{self.paths[-1]};{name}")
+        elif len(self.paths) > 1:  # return / c_return / c_exception
+            self.paths.pop()
+        self.last = time.perf_counter()  # keep the hook's own cost out of the profile
+
+class TickProfiler:
+    """Traces a deterministic sample of /api/tick calls (every Nth call) while armed."""
+    
+    def __init__(self):
+        self.session: Optional[dict] = None
+        self.busy = False
+    
+    def arm(self, ticks: int, every: int):
+        self.session = {"remaining": ticks, "every": max(every, 1), "seen": 0, "traced": 0, "counts": Counter()}
+    
+    def begin(self) -> bool:
+        session = self.session
+        if session is None or session["remaining"] <= 0:
+            return False
+        session["seen"] += 1
+        if (session["seen"] - 1) % session["every"]:
+            return False
+        sys.setprofile(CallTracer("handle_tick", session["counts"]))
+        return True
+    
+    def end(self, traced: bool):
+        if not traced:
+            return
+        sys.setprofile(None)
+        self.session["remaining"] -= 1
+        self.session["traced"] += 1
+    
+    @property
+    def done(self) -> bool:
+        return self.session is None or self.session["remaining"] <= 0
+
+tick_profiler = TickProfiler()
+
+# --- Decision Pipeline ---
+
+def process_tick(tick: TickData) -> dict:
+    """Run the decision pipeline for a parsed tick and return the EA command."""
+    rt = state.runtime
+    now_ts = time.time()
+    
+    # Position Book Update (must run even while blocked to keep deltas in sync)
+    if not ingest_positions(tick):
+        return {"action": "WAIT", "resync": True}
+    fill_tracer.observe(position_book.opened, now_ts)
+    
+    # Conflict Block
+    if rt.error_status:
+        print(f"[BLOCKED] Engine Locked: {rt.error_status}")
+        return {"action": "WAIT", "error": rt.error_status}
+
+    # Market Data Update
+    mid = (tick.ask + tick.bid) / 2
+    rt.current_ask = tick.ask
+    rt.current_bid = tick.bid
+    
+    if price_history:
+        rt.price_direction = "up" if mid > price_history[-1]['mid'] else "down"
+    
+    if price_history:
+        tick_intervals.record(now_ts - price_history[-1]['ts'])
+    price_history.append({"mid": mid, "ts": now_ts})
+    volatility.update(mid, now_ts)
+    refresh_grid_scale()
+    rt.current_price = mid
+    state.last_update_ts = datetime.now().isoformat()
+    
+    # Fast Path: No trigger crossed and no positions opened/closed -> WAIT
+    tick_metrics["ticks"] += 1
+    if tick_is_quiet(tick):
+        tick_metrics["fast_path"] += 1
+        return {"action": "WAIT"}
+    
+    # Update Stats
+    update_exec_stats()
+    if rt.error_status:
+         return {"action": "WAIT", "error": rt.error_status}
+
+    # Evaluate every layer; the first one with an order or close wins this tick
+    for layer in layer_names():
+        response = evaluate_layer(layer, tick, mid, now_ts)
+        if response["action"] != "WAIT":
+            return response
+    return {"action": "WAIT"}
+
+def evaluate_layer(layer: str, tick: TickData, mid: float, now_ts: float) -> dict:
+    """Priority chain for one layer's buy/sell vectors (positions already ingested)."""
+    st, rt = layer_parts(layer)
+    
+    # Priority 1: Pending Actions (Manual Overrides)
+    if rt.pending_actions:
+        action = rt.pending_actions.pop(0)
+        save_state()
+        cmt = "server"
+        if "BUY" in action: cmt = rt.buy_id
+        elif "SELL" in action: cmt = rt.sell_id
+        return {"action": "CLOSE_ALL", "comment": cmt}
+    
+    # --- PRIORITY 1.5: Closing Confirmation Monitor ---
+    
+    # Check Buy Closing Phase
+    if rt.buy_is_closing:
+        count = count_active_trades(rt.buy_id)
+        if count == 0:
+            print(f"[CONFIRMED] Buy Vector Closed. Resetting Session.")
+            rt.buy_is_closing = False
+            rt.buy_exec_map = {}
+            rt.buy_hedge_triggered = False
             
-            if rt.sell_waiting_limit:
-                if tick.bid >= st.sell_limit_price:
-                    rt.sell_waiting_limit = False
-                    rt.sell_start_ref = tick.bid
-                    print(f"[LIMIT TRIGGER] Sell Anchor Set at {rt.sell_start_ref}")
-                    save_state()
+            if rt.cyclic_on:
+                rt.buy_id = ""
+                rt.buy_start_ref = mid
+            else:
+                rt.buy_on = False
+                rt.buy_id = ""
+                rt.buy_start_ref = 0.0
+            save_state()
+            return {"action": "WAIT"}
+        else:
+            return {"action": "CLOSE_ALL", "comment": rt.buy_id}
+
+    # Check Sell Closing Phase
+    if rt.sell_is_closing:
+        count = count_active_trades(rt.sell_id)
+        if count == 0:
+            print(f"[CONFIRMED] Sell Vector Closed. Resetting Session.")
+            rt.sell_is_closing = False
+            rt.sell_exec_map = {}
+            rt.sell_hedge_triggered = False
+            
+            if rt.cyclic_on:
+                rt.sell_id = ""
+                rt.sell_start_ref = mid
             else:
-                idx = len(rt.sell_exec_map)
-                if idx < len(st.rows_sell):
-                    row = st.rows_sell[idx]
-                    if row.dollar <= 0 or row.lots <= 0:
-                        return {"action": "WAIT"}
-                    target = calculate_grid_level_price("sell", idx)
-                    if tick.bid >= target:
-                        rt.sell_exec_map[str(idx)] = RowExecStats(
-                            index=idx,
-                            entry_price=tick.bid, 
-                            lots=row.lots,
+                rt.sell_on = False
+                rt.sell_id = ""
+                rt.sell_start_ref = 0.0
+            save_state()
+            return {"action": "WAIT"}
+        else:
+            return {"action": "CLOSE_ALL", "comment": rt.sell_id}
+
+    # --- PRIORITY 1.8: HEDGE MONITOR (IronClad Protocol) ---
+    
+    # BUY SIDE HEDGE CHECK
+    if (rt.buy_on and rt.buy_id and not rt.buy_hedge_triggered and 
+        st.buy_hedge_value > 0 and not rt.buy_is_closing):
+        
+        if count_active_trades(rt.buy_id) > 0:
+            total_buy_profit = position_book.profit(rt.buy_id)
+            loss_threshold = -1 * st.buy_hedge_value
+            
+            if total_buy_profit <= loss_threshold:
+                print(f"[IRONCLAD ALERT] Buy Drawdown: ${total_buy_profit:.2f} <= Limit: ${loss_threshold:.2f}")
+                
+                # Lock the losing side
+                rt.buy_hedge_triggered = True
+                
+                # Calculate total hedge volume
+                hedge_lots = position_book.volume(rt.buy_id)
+                print(f"[HEDGE] Deploying Counter-Measure: {hedge_lots} lots SELL")
+                
+                # Check if opposite side is ready (not closing)
+                if not rt.sell_is_closing:
+                    # Scenario A: Sell Side is OFF or Empty
+                    if not rt.sell_on or not rt.sell_id or len(rt.sell_exec_map) == 0:
+                        print(f"[HEDGE] Initializing Emergency Sell Session")
+                        
+                        # Force start Sell Session
+                        rt.sell_id = get_hash("sell")
+                        rt.sell_start_ref = tick.bid
+                        rt.sell_exec_map = {}
+                        rt.sell_on = True
+                        rt.sell_waiting_limit = False
+                        
+                        # Clear and inject hedge row
+                        st.rows_sell = [GridRow(index=0, dollar=0.0, lots=hedge_lots, alert=True,
+                                                  version=next_settings_version())]
+                        invalidate_levels("sell", 0, layer)
+                        
+                        save_state()
+                        
+                        # Execute immediately
+                        rt.sell_exec_map["0"] = RowExecStats(
+                            index=0,
+                            entry_price=tick.bid,
+                            lots=hedge_lots,
                             profit=0,
                             timestamp=datetime.now().isoformat()
                         )
                         rt.sell_last_order_sent_ts = now_ts
-                        print(f"[GRID EXPANSION] Sell Strata {idx} Reached: {target}")
                         save_state()
+                        
+                        return {
+                            "action": "SELL",
+                            "volume": hedge_lots,
+                            "comment": f"{rt.sell_id}_idx0",
+                            "alert": True,
+                            "hedge": True
+                        }
+                    
+                    # Scenario B: Sell Side is Already Running
+                    else:
+                        print(f"[HEDGE] Augmenting Existing Sell Session")
+                        
+                        # Get last executed index
+                        indices = sorted([int(k) for k in rt.sell_exec_map.keys()])
+                        last_idx = indices[-1] if indices else -1
+                        new_idx = last_idx + 1
+                        
+                        # Get price of last level
+                        last_price = get_last_executed_price("sell", layer)
+                        
+                        # Calculate dynamic gap to current market
+                        new_dollar_gap = abs(tick.bid - last_price)
+                        
+                        # Inject new row
+                        new_row = GridRow(index=new_idx, dollar=new_dollar_gap, lots=hedge_lots, alert=True,
+                                          version=next_settings_version())
+                        st.rows_sell.append(new_row)
+                        invalidate_levels("sell", len(st.rows_sell) - 1, layer)
+                        
+                        save_state()
+                        
+                        # Execute immediately (gap designed to match current bid)
+                        rt.sell_exec_map[str(new_idx)] = RowExecStats(
+                            index=new_idx,
+                            entry_price=tick.bid,
+                            lots=hedge_lots,
+                            profit=0,
+                            timestamp=datetime.now().isoformat()
+                        )
+                        rt.sell_last_order_sent_ts = now_ts
+                        save_state()
+                        
                         return {
                             "action": "SELL",
-                            "volume": row.lots,
-                            "comment": f"{rt.sell_id}_idx{idx}",
-                            "alert": row.alert
+                            "volume": hedge_lots,
+                            "comment": f"{rt.sell_id}_idx{new_idx}",
+                            "alert": True,
+                            "hedge": True
                         }
+    
+    # SELL SIDE HEDGE CHECK
+    if (rt.sell_on and rt.sell_id and not rt.sell_hedge_triggered and 
+        st.sell_hedge_value > 0 and not rt.sell_is_closing):
         
-        return {"action": "WAIT"}
+        if count_active_trades(rt.sell_id) > 0:
+            total_sell_profit = position_book.profit(rt.sell_id)
+            loss_threshold = -1 * st.sell_hedge_value
+            
+            if total_sell_profit <= loss_threshold:
+                print(f"[IRONCLAD ALERT] Sell Drawdown: ${total_sell_profit:.2f} <= Limit: ${loss_threshold:.2f}")
+                
+                # Lock the losing side
+                rt.sell_hedge_triggered = True
+                
+                # Calculate total hedge volume
+                hedge_lots = position_book.volume(rt.sell_id)
+                print(f"[HEDGE] Deploying Counter-Measure: {hedge_lots} lots BUY")
+                
+                # Check if opposite side is ready (not closing)
+                if not rt.buy_is_closing:
+                    # Scenario A: Buy Side is OFF or Empty
+                    if not rt.buy_on or not rt.buy_id or len(rt.buy_exec_map) == 0:
+                        print(f"[HEDGE] Initializing Emergency Buy Session")
+                        
+                        # Force start Buy Session
+                        rt.buy_id = get_hash("buy")
+                        rt.buy_start_ref = tick.ask
+                        rt.buy_exec_map = {}
+                        rt.buy_on = True
+                        rt.buy_waiting_limit = False
+                        
+                        # Clear and inject hedge row
+                        st.rows_buy = [GridRow(index=0, dollar=0.0, lots=hedge_lots, alert=True,
+                                                  version=next_settings_version())]
+                        invalidate_levels("buy", 0, layer)
+                        
+                        save_state()
+                        
+                        # Execute immediately
+                        rt.buy_exec_map["0"] = RowExecStats(
+                            index=0,
+                            entry_price=tick.ask,
+                            lots=hedge_lots,
+                            profit=0,
+                            timestamp=datetime.now().isoformat()
+                        )
+                        rt.buy_last_order_sent_ts = now_ts
+                        save_state()
+                        
+                        return {
+                            "action": "BUY",
+                            "volume": hedge_lots,
+                            "comment": f"{rt.buy_id}_idx0",
+                            "alert": True,
+                            "hedge": True
+                        }
+                    
+                    # Scenario B: Buy Side is Already Running
+                    else:
+                        print(f"[HEDGE] Augmenting Existing Buy Session")
+                        
+                        # Get last executed index
+                        indices = sorted([int(k) for k in rt.buy_exec_map.keys()])
+                        last_idx = indices[-1] if indices else -1
+                        new_idx = last_idx + 1
+                        
+                        # Get price of last level
+                        last_price = get_last_executed_price("buy", layer)
+                        
+                        # Calculate dynamic gap to current market
+                        new_dollar_gap = abs(tick.ask - last_price)
+                        
+                        # Inject new row
+                        new_row = GridRow(index=new_idx, dollar=new_dollar_gap, lots=hedge_lots, alert=True,
+                                          version=next_settings_version())
+                        st.rows_buy.append(new_row)
+                        invalidate_levels("buy", len(st.rows_buy) - 1, layer)
+                        
+                        save_state()
+                        
+                        # Execute immediately (gap designed to match current ask)
+                        rt.buy_exec_map[str(new_idx)] = RowExecStats(
+                            index=new_idx,
+                            entry_price=tick.ask,
+                            lots=hedge_lots,
+                            profit=0,
+                            timestamp=datetime.now().isoformat()
+                        )
+                        rt.buy_last_order_sent_ts = now_ts
+                        save_state()
+                        
+                        return {
+                            "action": "BUY",
+                            "volume": hedge_lots,
+                            "comment": f"{rt.buy_id}_idx{new_idx}",
+                            "alert": True,
+                            "hedge": True
+                        }
+
+    # Priority 2: TP Logic - Check Buy Side
+    if rt.buy_id:
+        tp_result = check_tp_buy(tick, layer)
+        if tp_result == 1:
+            rt.buy_is_closing = True
+            print("[BUY SNAP-BACK] Profit Target Reached. Closing Vector...")
+            save_state()
+            return {"action": "CLOSE_ALL", "comment": rt.buy_id}
+
+    # Priority 2: TP Logic - Check Sell Side
+    if rt.sell_id:
+        tp_result = check_tp_sell(tick, layer)
+        if tp_result == 1:
+            rt.sell_is_closing = True
+            print("[SELL SNAP-BACK] Profit Target Reached. Closing Vector...")
+            save_state()
+            return {"action": "CLOSE_ALL", "comment": rt.sell_id}
+
+    # Priority 3: External Close (Manual Close Detection) - WITH GRACE PERIOD
+    
+    # Buy Side - Only check if grace period has passed
+    buy_grace_passed = (now_ts - rt.buy_last_order_sent_ts) >= EXTERNAL_CLOSE_GRACE_PERIOD
+    
+    if (rt.buy_id and len(rt.buy_exec_map) > 0 and not rt.buy_is_closing and buy_grace_passed):
+        mt5_count = count_active_trades(rt.buy_id)
+        
+        if mt5_count == 0:
+            print(f"[EXTERNAL CLOSE] Buy Session Manually Terminated.")
+            if rt.cyclic_on:
+                rt.buy_id = ""
+                rt.buy_exec_map = {}
+                rt.buy_start_ref = mid
+                rt.buy_hedge_triggered = False
+            else:
+                rt.buy_on = False
+                rt.buy_id = ""
+                rt.buy_exec_map = {}
+                rt.buy_hedge_triggered = False
+            save_state()
+
+    # Sell Side - Only check if grace period has passed
+    sell_grace_passed = (now_ts - rt.sell_last_order_sent_ts) >= EXTERNAL_CLOSE_GRACE_PERIOD
+    
+    if (rt.sell_id and len(rt.sell_exec_map) > 0 and not rt.sell_is_closing and sell_grace_passed):
+        mt5_count = count_active_trades(rt.sell_id)
+        
+        if mt5_count == 0:
+            print(f"[EXTERNAL CLOSE] Sell Session Manually Terminated.")
+            if rt.cyclic_on:
+                rt.sell_id = ""
+                rt.sell_exec_map = {}
+                rt.sell_start_ref = mid
+                rt.sell_hedge_triggered = False
+            else:
+                rt.sell_on = False
+                rt.sell_id = ""
+                rt.sell_exec_map = {}
+                rt.sell_hedge_triggered = False
+            save_state()
+    
+    # Priority 4: Elastic Grid Expansion - BUY (Accumulation Phase)
+    if rt.buy_on and not rt.buy_is_closing and not rt.buy_hedge_triggered:
+        if not rt.buy_id:
+            rt.buy_id = get_hash("buy")
+            rt.buy_exec_map = {}
+            rt.buy_start_ref = st.buy_limit_price if st.buy_limit_price > 0 else tick.ask
+            rt.buy_waiting_limit = st.buy_limit_price > 0
+            print(f"[ELASTIC START] Buy Vector Initiated: {rt.buy_id} | Anchor: {rt.buy_start_ref}")
+            save_state()
+        
+        if rt.buy_waiting_limit:
+            if tick.ask <= st.buy_limit_price:
+                rt.buy_waiting_limit = False
+                rt.buy_start_ref = tick.ask
+                print(f"[LIMIT TRIGGER] Buy Anchor Set at {rt.buy_start_ref}")
+                save_state()
+        else:
+            idx = len(rt.buy_exec_map)
+            if idx < len(st.rows_buy):
+                row = st.rows_buy[idx]
+                if row.dollar <= 0 or row.lots <= 0:
+                    return {"action": "WAIT"} 
+                target = calculate_grid_level_price("buy", idx, layer)
+                if tick.ask <= target:
+                    rt.buy_exec_map[str(idx)] = RowExecStats(
+                        index=idx, 
+                        entry_price=tick.ask, 
+                        lots=row.lots,
+                        profit=0, 
+                        timestamp=datetime.now().isoformat(),
+                        gap_scale=grid_scale.get(layer, 1.0)
+                    )
+                    rt.buy_last_order_sent_ts = now_ts
+                    print(f"[GRID EXPANSION] Buy Strata {idx} Reached: {target}")
+                    save_state()
+                    return {
+                        "action": "BUY",
+                        "volume": row.lots,
+                        "comment": f"{rt.buy_id}_idx{idx}",
+                        "alert": row.alert
+                    }
+    
+    # Priority 5: Elastic Grid Expansion - SELL (Accumulation Phase)
+    if rt.sell_on and not rt.sell_is_closing and not rt.sell_hedge_triggered:
+        if not rt.sell_id:
+            rt.sell_id = get_hash("sell")
+            rt.sell_exec_map = {}
+            rt.sell_start_ref = st.sell_limit_price if st.sell_limit_price > 0 else tick.bid
+            rt.sell_waiting_limit = st.sell_limit_price > 0
+            print(f"[ELASTIC START] Sell Vector Initiated: {rt.sell_id} | Anchor: {rt.sell_start_ref}")
+            save_state()
+        
+        if rt.sell_waiting_limit:
+            if tick.bid >= st.sell_limit_price:
+                rt.sell_waiting_limit = False
+                rt.sell_start_ref = tick.bid
+                print(f"[LIMIT TRIGGER] Sell Anchor Set at {rt.sell_start_ref}")
+                save_state()
+        else:
+            idx = len(rt.sell_exec_map)
+            if idx < len(st.rows_sell):
+                row = st.rows_sell[idx]
+                if row.dollar <= 0 or row.lots <= 0:
+                    return {"action": "WAIT"}
+                target = calculate_grid_level_price("sell", idx, layer)
+                if tick.bid >= target:
+                    rt.sell_exec_map[str(idx)] = RowExecStats(
+                        index=idx,
+                        entry_price=tick.bid, 
+                        lots=row.lots,
+                        profit=0,
+                        timestamp=datetime.now().isoformat(),
+                        gap_scale=grid_scale.get(layer, 1.0)
+                    )
+                    rt.sell_last_order_sent_ts = now_ts
+                    print(f"[GRID EXPANSION] Sell Strata {idx} Reached: {target}")
+                    save_state()
+                    return {
+                        "action": "SELL",
+                        "volume": row.lots,
+                        "comment": f"{rt.sell_id}_idx{idx}",
+                        "alert": row.alert
+                    }
+    
+    return {"action": "WAIT"}
+
+# --- FastAPI App ---
+
+app = FastAPI(title="Elastic DCA Engine", version="3.4.2")
+
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"],
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+
+@app.exception_handler(RequestValidationError)
+async def validation_handler(request: Request, exc: RequestValidationError):
+    print("=" * 80)
+    print("[VALIDATION ERROR]")
+    body = await request.body()
+    print(f"Body: {body.decode('utf-8')[:500]}")
+    print(f"Errors: {exc.errors()}")
+    print("=" * 80)
+    return JSONResponse(status_code=422, content={"detail": exc.errors()})
+
+@app.on_event("startup")
+async def startup():
+    print("=" * 60)
+    print("Elastic DCA Engine v3.4.2")
+    print("Status: ONLINE | IronClad Protection: READY")
+    print("=" * 60)
+    load_state()
+    await replicator.start()
+
+@app.get("/")
+async def root():
+    return {"status": "running", "system": "Elastic DCA Engine", "version": "3.4.2"}
+
+def dispatch_tick(tick: TickData) -> dict:
+    """Decide on a parsed tick: retry replay, pipeline, then response annotations."""
+    if tick.request_id:
+        cached = dispatch_cache.get(tick.request_id)
+        if cached is not None:
+            tick_metrics["replays"] += 1
+            if cached["action"] != "WAIT":
+                print(f"[DEDUPE] Replaying {cached['action']} for retried tick {tick.request_id}")
+            return cached
+    
+    response = process_tick(tick)
+    if response["action"] in ("BUY", "SELL"):
+        response["decision_id"] = fill_tracer.decided(response, tick, time.time())
+    response["next_poll_ms"] = recommend_poll_ms(tick, response)
+    poll_hints.record(response["next_poll_ms"])
+    if replicator.enabled:
+        response["fence"] = state.fence_token
+    if tick.request_id:
+        dispatch_cache.put(tick.request_id, response)
+    return response
+
+class BacklogTooLarge(Exception):
+    """Upload above BACKLOG_MAX_TICKS or BACKLOG_MAX_BYTES (answered with 413)."""
+
+def inflate(body: bytes, wbits: int) -> bytes:
+    """Decompress with a bound on the output size, so a small upload cannot inflate without limit."""
+    stream = zlib.decompressobj(wbits)
+    data = stream.decompress(body, BACKLOG_MAX_BYTES)
+    if stream.unconsumed_tail:
+        raise BacklogTooLarge(f"Backlog inflates beyond {BACKLOG_MAX_BYTES} bytes")
+    if not stream.eof:
+        raise zlib.error("Truncated compressed stream")
+    return data
+
+def decode_backlog(body: bytes) -> str:
+    """Backlog bodies may be plain JSON, gzip/zlib (auto-detected) or raw deflate."""
+    if body[:1] in (b'{', b'['):
+        body = body.rstrip(b'\x00')
+    else:
+        try:
+            body = inflate(body, 47)
+        except zlib.error:
+            body = inflate(body, -15)
+    return body.decode('utf-8', errors='ignore')
+
+def parse_backlog(body: bytes, received_ts: float) -> tuple:
+    """
+    Decode and validate an upload into ([(ts, mid), ...], latest tick). Runs in a
+    worker thread; raises ValueError/KeyError/TypeError/zlib.error on bad input.
+    """
+    payload = json.loads(decode_backlog(body))
+    if not isinstance(payload, dict):
+        raise ValueError("Backlog must be a JSON object")
+    buffered = payload.get("ticks", [])
+    if not isinstance(buffered, list):
+        raise ValueError("'ticks' must be a list")
+    if len(buffered) > BACKLOG_MAX_TICKS:
+        raise BacklogTooLarge(f"Backlog exceeds {BACKLOG_MAX_TICKS} ticks")
+    tick = TickData(**payload["latest"])
+    
+    points = []
+    for n, entry in enumerate(buffered):
+        if (not isinstance(entry, list) or len(entry) != 3
+                or not all(type(v) in (int, float) and math.isfinite(v) for v in entry)):
+            raise ValueError(f"ticks[{n}] is not [age_ms, ask, bid]")
+        age_ms, ask, bid = entry
+        if ask > 0 and bid > 0:
+            points.append((received_ts - age_ms / 1000.0, (ask + bid) / 2))
+    return points, tick
+
+def replay_backlog(points: List[tuple]) -> int:
+    """
+    Feed buffered (ts, mid) points (oldest first) into price history and
+    volatility statistics. No decisions are taken, so no stale orders are sent.
+    Points not newer than the last recorded one are skipped.
+    """
+    last_ts = price_history[-1]['ts'] if price_history else 0.0
+    fresh = []
+    update = volatility.update
+    for ts, mid in points:
+        if ts <= last_ts:
+            continue
+        update(mid, ts)
+        fresh.append((ts, mid))
+        last_ts = ts
+    # Only the newest PRICE_HISTORY_LEN points would survive in the deque anyway
+    price_history.extend({"mid": mid, "ts": ts} for ts, mid in fresh[-PRICE_HISTORY_LEN:])
+    tick_metrics["backlog"] += len(fresh)
+    return len(fresh)
+
+@app.post("/api/tick")
+async def handle_tick(request: Request):
+    await replicator.accept_failover()
+    blocked = standby_guard()
+    if blocked:
+        return blocked
+    started = time.perf_counter()
+    tick_lane.enter()
+    traced = False
+    try:
+        # Raw Body Parsing
+        body_bytes = await request.body()
+        traced = tick_profiler.begin()
+        body_str = body_bytes.decode('utf-8', errors='ignore')
+        body_str = body_str.rstrip('\x00').strip()
+        last_brace = body_str.rfind('}')
+        if last_brace != -1:
+            body_str = body_str[:last_brace + 1]
+        
+        try:
+            tick_data = json.loads(body_str)
+            tick = TickData(**tick_data)
+        except json.JSONDecodeError as e:
+            print(f"[ERROR] JSON Parse: {e}")
+            return {"action": "WAIT"}
+        
+        return dispatch_tick(tick)
         
     except Exception as e:
         print(f"[ERROR] Tick Processing Failed: {e}")
         traceback.print_exc()
         return {"action": "WAIT"}
+    finally:
+        tick_profiler.end(traced)
+        tick_lane.leave()
+        tick_latency.record(time.perf_counter() - started)
 
-@app.post("/api/update-settings")
-async def update_settings(new: UserSettings):
+@app.post("/api/tick/backlog")
+async def handle_backlog(request: Request):
+    """
+    Catch up after an outage: {"ticks": [[age_ms, ask, bid], ...], "latest": <tick>}.
+    Buffered ticks only update market statistics; the decision runs on `latest`.
+    """
+    await replicator.accept_failover()
+    blocked = standby_guard()
+    if blocked:
+        return blocked
+    started = time.perf_counter()
+    received_ts = time.time()
+    tick_lane.enter()
     try:
-        rt = state.runtime
-        
-        # Validation
-        if new.buy_tp_value < 0 or new.sell_tp_value < 0:
-             raise Exception("TP values cannot be negative")
-        
-        if new.buy_hedge_value < 0 or new.sell_hedge_value < 0:
-             raise Exception("Hedge values cannot be negative")
-
-        # Update separate limit prices
-        state.settings.buy_limit_price = new.buy_limit_price
-        state.settings.sell_limit_price = new.sell_limit_price
-        
-        # Update separate TP settings
-        state.settings.buy_tp_type = new.buy_tp_type
-        state.settings.buy_tp_value = new.buy_tp_value
-        state.settings.sell_tp_type = new.sell_tp_type
-        state.settings.sell_tp_value = new.sell_tp_value
+        body = await request.body()
+        try:
+            if len(body) > BACKLOG_MAX_BYTES:
+                raise BacklogTooLarge(f"Backlog exceeds {BACKLOG_MAX_BYTES} bytes")
+            # Decoding and validation stay off the loop so ticks and replication heartbeats keep flowing
+            loop = asyncio.get_running_loop()
+            points, tick = await loop.run_in_executor(None, parse_backlog, body, received_ts)
+        except BacklogTooLarge as e:
+            return JSONResponse(status_code=413, content={"detail": str(e)})
+        except (ValueError, KeyError, TypeError, zlib.error) as e:
+            print(f"[ERROR] Backlog Parse: {e}")
+            return JSONResponse(status_code=400, content={"detail": f"Invalid backlog: {e}"})
         
-        # Update hedge settings
-        state.settings.buy_hedge_value = new.buy_hedge_value
-        state.settings.sell_hedge_value = new.sell_hedge_value
+        replayed = replay_backlog(points)
+        if replayed:
+            print(f"[BACKLOG] Replayed {replayed} buffered ticks ({len(points) - replayed} skipped)")
+            save_state()
         
-        # --- Buy Rows ---
-        final_buy_rows = []
-        current_buy_rows_dict = {r.index: r for r in state.settings.rows_buy}
+        return {**dispatch_tick(tick), "replayed": replayed}
         
-        for new_row in new.rows_buy:
-            if new_row.dollar <= 0 or new_row.lots <= 0:
-                continue
+    except Exception as e:
+        print(f"[ERROR] Backlog Processing Failed: {e}")
+        traceback.print_exc()
+        return {"action": "WAIT"}
+    finally:
+        tick_lane.leave()
+        tick_latency.record(time.perf_counter() - started)
 
-            # If executed, use OLD data for locked fields, but NEW data for Alert
-            if str(new_row.index) in rt.buy_exec_map and new_row.index in current_buy_rows_dict:
-                 old = current_buy_rows_dict[new_row.index]
-                 merged_row = GridRow(
-                     index=old.index,
-                     dollar=old.dollar,
-                     lots=old.lots,
-                     alert=new_row.alert
-                 )
-                 final_buy_rows.append(merged_row)
-            else:
-                 final_buy_rows.append(new_row)
-        
-        state.settings.rows_buy = final_buy_rows
+def apply_settings(new: UserSettings, layer: str = MAIN_LAYER):
+    """Install new settings on a layer, keeping executed strata locked."""
+    st, rt = layer_parts(layer)
+    
+    # Validation
+    if new.buy_tp_value < 0 or new.sell_tp_value < 0:
+         raise Exception("TP values cannot be negative")
+    
+    if new.buy_hedge_value < 0 or new.sell_hedge_value < 0:
+         raise Exception("Hedge values cannot be negative")
+    
+    if new.grid_mode not in ("fixed", "volatility"):
+         raise Exception(f"Unknown grid mode: {new.grid_mode}")
+    
+    if new.vol_reference_atr < 0:
+         raise Exception("Volatility reference ATR cannot be negative")
+    
+    if new.vol_scale_min <= 0 or new.vol_scale_min > new.vol_scale_max:
+         raise Exception("Volatility scale bounds must satisfy 0 < vol_scale_min <= vol_scale_max")
 
-        # --- Sell Rows ---
-        final_sell_rows = []
-        current_sell_rows_dict = {r.index: r for r in state.settings.rows_sell}
-        
-        for new_row in new.rows_sell:
-            if new_row.dollar <= 0 or new_row.lots <= 0:
-                continue
+    fields_before = {side: side_fields(side, layer) for side in ("buy", "sell")}
 
-            if str(new_row.index) in rt.sell_exec_map and new_row.index in current_sell_rows_dict:
-                 old = current_sell_rows_dict[new_row.index]
-                 merged_row = GridRow(
-                     index=old.index,
-                     dollar=old.dollar,
-                     lots=old.lots,
-                     alert=new_row.alert
-                 )
-                 final_sell_rows.append(merged_row)
-            else:
-                 final_sell_rows.append(new_row)
-                 
-        state.settings.rows_sell = final_sell_rows
-        
+    # Update separate limit prices
+    st.buy_limit_price = new.buy_limit_price
+    st.sell_limit_price = new.sell_limit_price
+    
+    # Update separate TP settings
+    st.buy_tp_type = new.buy_tp_type
+    st.buy_tp_value = new.buy_tp_value
+    st.sell_tp_type = new.sell_tp_type
+    st.sell_tp_value = new.sell_tp_value
+    
+    # Update hedge settings
+    st.buy_hedge_value = new.buy_hedge_value
+    st.sell_hedge_value = new.sell_hedge_value
+    
+    for side in ("buy", "sell"):
+        if side_fields(side, layer) != fields_before[side]:
+            setattr(st, f"{side}_version", next_settings_version())
+    
+    # Update grid mode (volatility scaling)
+    st.grid_mode = new.grid_mode
+    st.vol_reference_atr = new.vol_reference_atr
+    st.vol_scale_min = new.vol_scale_min
+    st.vol_scale_max = new.vol_scale_max
+    refresh_grid_scale()
+    
+    # --- Buy Rows ---
+    final_buy_rows = []
+    current_buy_rows_dict = {r.index: r for r in st.rows_buy}
+    
+    for new_row in new.rows_buy:
+        if new_row.dollar <= 0 or new_row.lots <= 0:
+            continue
+
+        # If executed, use OLD data for locked fields, but NEW data for Alert
+        if str(new_row.index) in rt.buy_exec_map and new_row.index in current_buy_rows_dict:
+             old = current_buy_rows_dict[new_row.index]
+             merged_row = GridRow(
+                 index=old.index,
+                 dollar=old.dollar,
+                 lots=old.lots,
+                 alert=new_row.alert
+             )
+             final_buy_rows.append(merged_row)
+        else:
+             final_buy_rows.append(new_row)
+    
+    install_rows("buy", final_buy_rows, layer)
+
+    # --- Sell Rows ---
+    final_sell_rows = []
+    current_sell_rows_dict = {r.index: r for r in st.rows_sell}
+    
+    for new_row in new.rows_sell:
+        if new_row.dollar <= 0 or new_row.lots <= 0:
+            continue
+
+        if str(new_row.index) in rt.sell_exec_map and new_row.index in current_sell_rows_dict:
+             old = current_sell_rows_dict[new_row.index]
+             merged_row = GridRow(
+                 index=old.index,
+                 dollar=old.dollar,
+                 lots=old.lots,
+                 alert=new_row.alert
+             )
+             final_sell_rows.append(merged_row)
+        else:
+             final_sell_rows.append(new_row)
+             
+    install_rows("sell", final_sell_rows, layer)
+
+@app.post("/api/update-settings")
+async def update_settings(new: UserSettings):
+    blocked = standby_guard()
+    if blocked:
+        return blocked
+    try:
+        apply_settings(new)
         save_state()
         print("[CONFIG] System Settings Updated")
         return {"status": "ok"}
@@ -869,22 +2279,143 @@ async def update_settings(new: UserSettings):
         print(f"[ERROR] Settings Update Failed: {e}")
         raise
 
+def patch_row(side: str, patch: RowPatch, layer: str = MAIN_LAYER):
+    """Apply one row patch in place, recomputing only the level offsets it moves."""
+    st, rt = layer_parts(layer)
+    rows = st.rows_buy if side == "buy" else st.rows_sell
+    exec_map = rt.buy_exec_map if side == "buy" else rt.sell_exec_map
+    
+    pos = next((i for i, r in enumerate(rows) if r.index == patch.index), -1)
+    current = rows[pos] if pos >= 0 else None
+    
+    row = current.model_copy() if current else GridRow(index=patch.index, dollar=0.0, lots=0.0)
+    # Executed strata keep their gap and volume; only the alert flag is editable
+    if str(patch.index) not in exec_map or current is None:
+        if patch.dollar is not None: row.dollar = patch.dollar
+        if patch.lots is not None: row.lots = patch.lots
+    if patch.alert is not None: row.alert = patch.alert
+    
+    if current is not None and (row.dollar, row.lots, row.alert) == (current.dollar, current.lots, current.alert):
+        return
+    
+    # Rows are never removed here: hedge rows (dollar 0) stay editable, e.g. to acknowledge their alert
+    row.version = next_settings_version()
+    if current is None:
+        # Keep strata ordered by index; the list position drives level prices
+        pos = next((i for i, r in enumerate(rows) if r.index > row.index), len(rows))
+        rows.insert(pos, row)
+        invalidate_levels(side, pos, layer)
+    else:
+        rows[pos] = row
+        if row.dollar != current.dollar:
+            invalidate_levels(side, pos, layer)
+
+def patch_rows(side: str, patches: List[RowPatch], layer: str = MAIN_LAYER):
+    if side not in ("buy", "sell"):
+        return JSONResponse(status_code=404, content={"detail": f"Unknown side '{side}'"})
+    if layer != MAIN_LAYER and layer not in state.layers:
+        return JSONResponse(status_code=404, content={"detail": f"Unknown layer: {layer}"})
+    
+    # All-or-nothing: verify every expected version before touching anything
+    st, _ = layer_parts(layer)
+    rows = st.rows_buy if side == "buy" else st.rows_sell
+    versions = {r.index: r.version for r in rows}
+    for patch in patches:
+        current_version = versions.get(patch.index, 0)
+        if patch.expected_version is not None and patch.expected_version != current_version:
+            return JSONResponse(status_code=409, content={
+                "detail": f"Row {patch.index} changed (version {current_version}, expected {patch.expected_version})",
+                "version": current_version
+            })
+        if (patch.dollar is not None and patch.dollar <= 0) or (patch.lots is not None and patch.lots <= 0):
+            return JSONResponse(status_code=422, content={"detail": f"Row {patch.index}: gap and lots must be positive"})
+        if patch.index not in versions and (patch.dollar is None or patch.lots is None):
+            return JSONResponse(status_code=422, content={"detail": f"Row {patch.index} does not exist; a new row needs dollar and lots"})
+    
+    for patch in patches:
+        patch_row(side, patch, layer)
+    
+    save_state()
+    touched = {p.index for p in patches}
+    return {
+        "status": "ok",
+        "settings_version": state.settings_version,
+        "rows": [r.model_dump() for r in rows if r.index in touched]
+    }
+
+@app.patch("/api/settings/{side}/rows/{index}")
+async def patch_settings_row(side: str, index: int, patch: RowPatch, layer: str = MAIN_LAYER):
+    blocked = standby_guard()
+    if blocked:
+        return blocked
+    patch.index = index
+    return patch_rows(side, [patch], layer)
+
+@app.patch("/api/settings/{side}/rows")
+async def patch_settings_rows(side: str, patch: RowRangePatch, layer: str = MAIN_LAYER):
+    blocked = standby_guard()
+    if blocked:
+        return blocked
+    return patch_rows(side, patch.rows, layer)
+
+@app.patch("/api/settings/{side}")
+async def patch_settings_side(side: str, patch: SidePatch, layer: str = MAIN_LAYER):
+    blocked = standby_guard()
+    if blocked:
+        return blocked
+    if side not in ("buy", "sell"):
+        return JSONResponse(status_code=404, content={"detail": f"Unknown side '{side}'"})
+    if layer != MAIN_LAYER and layer not in state.layers:
+        return JSONResponse(status_code=404, content={"detail": f"Unknown layer: {layer}"})
+    
+    st, _ = layer_parts(layer)
+    current_version = getattr(st, f"{side}_version")
+    if patch.expected_version is not None and patch.expected_version != current_version:
+        return JSONResponse(status_code=409, content={
+            "detail": f"{side.capitalize()} settings changed (version {current_version}, expected {patch.expected_version})",
+            "version": current_version
+        })
+    
+    if (patch.tp_value is not None and patch.tp_value < 0) or (patch.hedge_value is not None and patch.hedge_value < 0):
+        return JSONResponse(status_code=422, content={"detail": "TP and hedge values cannot be negative"})
+    
+    before = side_fields(side, layer)
+    for field in ("limit_price", "tp_type", "tp_value", "hedge_value"):
+        value = getattr(patch, field)
+        if value is not None:
+            setattr(st, f"{side}_{field}", value)
+    
+    if side_fields(side, layer) != before:
+        setattr(st, f"{side}_version", next_settings_version())
+        save_state()
+        print(f"[CONFIG] {side.capitalize()} Settings Patched")
+    return {"status": "ok", "version": getattr(st, f"{side}_version")}
+
 @app.post("/api/control")
 async def control(
     buy_switch: Optional[bool] = Body(None),
     sell_switch: Optional[bool] = Body(None),
     cyclic: Optional[bool] = Body(None),
-    emergency_close: Optional[bool] = Body(None)
+    emergency_close: Optional[bool] = Body(None),
+    layer: str = Body(MAIN_LAYER)
 ):
+    blocked = standby_guard()
+    if blocked:
+        return blocked
+    if layer != MAIN_LAYER and layer not in state.layers:
+        return JSONResponse(status_code=404, content={"detail": f"Unknown layer: {layer}"})
     try:
-        rt = state.runtime
+        _, rt = layer_parts(layer)
         
         if emergency_close:
+            # Closes every position on the account, so every layer stands down
             print("[EMERGENCY] CLOSE ALL COMMAND RECEIVED")
-            rt.buy_on = rt.sell_on = rt.cyclic_on = False
-            rt.buy_is_closing = rt.sell_is_closing = True 
-            rt.pending_actions.append("CLOSE_ALL_EMERGENCY")
-            rt.error_status = "" 
+            for name in layer_names():
+                _, lrt = layer_parts(name)
+                lrt.buy_on = lrt.sell_on = lrt.cyclic_on = False
+                lrt.buy_is_closing = lrt.sell_is_closing = True
+            state.runtime.pending_actions.append("CLOSE_ALL_EMERGENCY")
+            state.runtime.error_status = "" 
             save_state()
             return {"status": "emergency"}
         
@@ -909,18 +2440,114 @@ async def control(
         print(f"[ERROR] Control Command Failed: {e}")
         raise
 
-@app.get("/api/ui-data")
-async def ui_data():
+# --- Vector Layers ---
+
+def capture_layers() -> dict:
+    return {
+        name: (detach(st), detach(rt), grid_scale.get(name, 1.0))
+        for name in layer_names()
+        for st, rt in [layer_parts(name)]
+    }
+
+def build_layers(snap: dict) -> dict:
+    return {
+        name: {"settings": st.model_dump(), "runtime": rt.model_dump(), "grid_scale": scale}
+        for name, (st, rt, scale) in snap.items()
+    }
+
+@app.get("/api/layers")
+async def list_layers():
+    if tick_lane.pool is None:
+        update_exec_stats()
+        return build_layers(capture_layers())
+    await tick_lane.yield_to_ticks()
+    update_exec_stats()
+    return await tick_lane.serve_snapshot("layers", (state_epoch, tick_latency.count), capture_layers, build_layers)
+
+@app.post("/api/layers/{name}")
+async def upsert_layer(name: str, new: UserSettings):
+    """Create a layer (or update its settings). Control it via /api/control with "layer"."""
+    blocked = standby_guard()
+    if blocked:
+        return blocked
+    if not LAYER_NAME_PATTERN.match(name):
+        return JSONResponse(status_code=400, content={"detail": f"Invalid layer name: {name}"})
+    
+    created = name != MAIN_LAYER and name not in state.layers
+    if created:
+        state.layers[name] = VectorLayer()
+    try:
+        apply_settings(new, name)
+    except Exception as e:
+        if created:
+            del state.layers[name]
+        print(f"[ERROR] Layer Update Failed: {e}")
+        raise
+    save_state()
+    print(f"[CONFIG] Layer {name} {'Created' if created else 'Updated'}")
+    return {"status": "ok", "created": created}
+
+@app.delete("/api/layers/{name}")
+async def delete_layer(name: str):
+    blocked = standby_guard()
+    if blocked:
+        return blocked
+    if name == MAIN_LAYER:
+        return JSONResponse(status_code=400, content={"detail": "The main layer cannot be deleted"})
+    if name not in state.layers:
+        return JSONResponse(status_code=404, content={"detail": f"Unknown layer: {name}"})
+    
+    rt = state.layers[name].runtime
+    if rt.buy_on or rt.sell_on or rt.buy_id or rt.sell_id:
+        return JSONResponse(status_code=409, content={"detail": f"Layer {name} still has active vectors"})
+    
+    del state.layers[name]
+    level_offsets.pop(name, None)
+    level_basis.pop(name, None)
+    grid_scale.pop(name, None)
+    save_state()
+    print(f"[CONFIG] Layer {name} Deleted")
+    return {"status": "ok"}
+
+def capture_ui_data() -> dict:
+    """Detached copy of everything /api/ui-data shows (cheap; safe to render off the loop)."""
+    return {
+        "settings": detach(state.settings),
+        "runtime": detach(state.runtime),
+        "layers": {name: (detach(layer.settings), detach(layer.runtime)) for name, layer in state.layers.items()},
+        "history": list(price_history),
+        "volatility": volatility.snapshot(),
+        "grid_scale": grid_scale.get(MAIN_LAYER, 1.0),
+        "last_update": state.last_update_ts,
+    }
+
+def build_ui_data(snap: dict) -> dict:
+    history = snap["history"]
     return {
-        "settings": state.settings.model_dump(),
-        "runtime": state.runtime.model_dump(),
+        "settings": snap["settings"].model_dump(),
+        "runtime": snap["runtime"].model_dump(),
+        "layers": {name: {"settings": st.model_dump(), "runtime": rt.model_dump()} for name, (st, rt) in snap["layers"].items()},
         "market": {
-            "history": list(price_history),
-            "current": price_history[-1] if price_history else None
+            "history": history,
+            "current": history[-1] if history else None,
+            "volatility": snap["volatility"],
+            "grid_scale": snap["grid_scale"]
         },
-        "last_update": state.last_update_ts
+        "last_update": snap["last_update"]
     }
 
+@app.get("/api/ui-data")
+async def ui_data():
+    if tick_lane.pool is None:
+        # Fast-path ticks defer exec-map refreshes; apply them before display
+        update_exec_stats()
+        return build_ui_data(capture_ui_data())
+    
+    # Priority mode: snapshot between ticks (once per state change), dump and encode off the loop
+    await tick_lane.yield_to_ticks()
+    update_exec_stats()
+    return await tick_lane.serve_snapshot("ui-data", (state_epoch, tick_latency.count), capture_ui_data, build_ui_data)
+
 @app.get("/api/health")
 async def health():
     rt = state.runtime
@@ -928,11 +2555,111 @@ async def health():
         "status": "healthy" if not rt.error_status else "error",
         "error": rt.error_status,
         "version": "3.4.2",
+        "protocol": TICK_PROTOCOL_VERSION,
+        "role": replicator.role,
+        "fence": state.fence_token,
         "buy": rt.buy_on,
         "sell": rt.sell_on,
         "price": rt.current_price
     }
 
+def capture_metrics() -> dict:
+    return {
+        "counters": dict(tick_metrics),
+        "tick_latency": tick_latency.copy(),
+        "tick_intervals": tick_intervals.copy(),
+        "poll_hints": poll_hints.copy(),
+        "volatility": volatility.snapshot(),
+        "grid_scale": grid_scale.get(MAIN_LAYER, 1.0),
+        "layers": len(state.layers) + 1,
+        "fills": fill_tracer.copy(),
+    }
+
+def build_metrics(snap: dict) -> dict:
+    counters = snap["counters"]
+    ticks = counters["ticks"]
+    return {
+        "ticks": ticks,
+        "fast_path_hits": counters["fast_path"],
+        "fast_path_hit_rate": (counters["fast_path"] / ticks) if ticks else 0.0,
+        "dispatch_replays": counters["replays"],
+        "backlog_ticks": counters["backlog"],
+        "scheduling_mode": tick_lane.mode,
+        "tick_latency_ms": snap["tick_latency"].summary(scale=1000.0),
+        "tick_interval_ms": snap["tick_intervals"].summary(scale=1000.0),
+        "poll_hint_ms": snap["poll_hints"].summary(),
+        "volatility": snap["volatility"],
+        "grid_scale": snap["grid_scale"],
+        "layers": snap["layers"],
+        "fills": snap["fills"].summary(),
+    }
+
+@app.get("/api/metrics")
+async def metrics():
+    if tick_lane.pool is None:
+        return build_metrics(capture_metrics())
+    await tick_lane.yield_to_ticks()
+    return await tick_lane.serve_snapshot("metrics", (state_epoch, tick_latency.count), capture_metrics, build_metrics)
+
+@app.post("/api/admin/profile")
+async def profile(req: ProfileRequest):
+    """
+    Profile the live engine without restarting it. "sample" snapshots thread
+    stacks for `seconds`; "ticks" traces every `every`-th /api/tick call until
+    `ticks` calls were traced. Weights are samples or microseconds of self time.
+    """
+    if req.mode not in ("sample", "ticks"):
+        return JSONResponse(status_code=400, content={"detail": f"Unknown profile mode: {req.mode}"})
+    if tick_profiler.busy:
+        return JSONResponse(status_code=409, content={"detail": "A profile is already running"})
+    
+    seconds = min(max(req.seconds, 0.0), PROFILE_MAX_SECONDS)
+    tick_profiler.busy = True
+    started = time.perf_counter()
+    try:
+        if req.mode == "sample":
+            interval = max(req.interval_ms, PROFILE_MIN_INTERVAL_MS) / 1000.0
+            loop = asyncio.get_running_loop()
+            counts, samples = await loop.run_in_executor(None, sample_stacks, seconds, interval, req.all_threads)
+            result = {"samples": samples, "unit": "samples"}
+        else:
+            tick_profiler.arm(req.ticks, req.every)
+            while not tick_profiler.done and time.perf_counter() - started < seconds:
+                await asyncio.sleep(0.05)
+            session = tick_profiler.session
+            tick_profiler.session = None
+            counts = session["counts"]
+            result = {"ticks_seen": session["seen"], "ticks_traced": session["traced"], "unit": "us"}
+    finally:
+        tick_profiler.busy = False
+    
+    print(f"[PROFILE] {req.mode} profile finished in {time.perf_counter() - started:.2f}s")
+    return {
+        "mode": req.mode,
+        "duration": time.perf_counter() - started,
+        **result,
+        "top": top_frames(counts),
+        "collapsed": collapse(counts),
+    }
+
+def capture_fills() -> dict:
+    return {
+        "engine": {"role": replicator.role, "fence": state.fence_token, "port": SERVER_PORT},
+        "tracer": fill_tracer.copy(),
+    }
+
+def build_fills(snap: dict) -> dict:
+    tracer = snap["tracer"]
+    return {"engine": snap["engine"], **tracer.summary(), "strata": tracer.report()}
+
+@app.get("/api/fills")
+async def fills():
+    """Decision-to-fill latency and slippage per layer and strata, as seen by this engine."""
+    if tick_lane.pool is None:
+        return build_fills(capture_fills())
+    await tick_lane.yield_to_ticks()
+    return await tick_lane.serve_snapshot("fills", (state_epoch, tick_latency.count), capture_fills, build_fills)
+
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000, log_level="info")
\ No newline at end of file
+    uvicorn.run(app, host="0.0.0.0", port=SERVER_PORT, log_level="info")
\ No newline at end of file
@@ -0,0 +1,67 @@
+"""Outage backlog uploads: malformed entries are 400, oversized uploads are 413."""
+
+import json
+import zlib
+
+import pytest
+from fastapi.testclient import TestClient
+
+LATEST = {"account_id": "1", "equity": 10000.0, "balance": 10000.0, "symbol": "XAUUSD",
+          "ask": 2000.1, "bid": 1999.9, "positions": []}
+
+
+def deflate(payload: dict) -> bytes:
+    packer = zlib.compressobj(9, zlib.DEFLATED, -15)
+    return packer.compress(json.dumps(payload).encode()) + packer.flush()
+
+
+@pytest.fixture
+def client(fresh_engine):
+    engine = fresh_engine()
+    return engine, TestClient(engine.app)
+
+
+def test_backlog_replays_into_price_history(client):
+    engine, http = client
+    ticks = [[5000 - n * 1000, 2000.1 + n, 1999.9 + n] for n in range(5)]
+
+    response = http.post("/api/tick/backlog", content=deflate({"ticks": ticks, "latest": LATEST}))
+
+    assert response.status_code == 200
+    assert response.json()["replayed"] == 5
+    assert engine.tick_metrics["backlog"] == 5
+
+
+@pytest.mark.parametrize("ticks", [
+    [[1000, 2000.1]],
+    [[1000, "2000.1", 1999.9]],
+    [[1000, True, 1999.9]],
+    [None],
+    {"0": [1000, 2000.1, 1999.9]},
+])
+def test_malformed_entries_are_rejected(client, ticks):
+    engine, http = client
+    response = http.post("/api/tick/backlog", content=json.dumps({"ticks": ticks, "latest": LATEST}))
+
+    assert response.status_code == 400
+    assert len(engine.price_history) == 0
+
+
+def test_too_many_ticks_is_rejected(client):
+    engine, http = client
+    ticks = [[0, 2000.1, 1999.9]] * (engine.BACKLOG_MAX_TICKS + 1)
+
+    response = http.post("/api/tick/backlog", content=deflate({"ticks": ticks, "latest": LATEST}))
+
+    assert response.status_code == 413
+
+
+def test_inflation_is_bounded(client):
+    engine, http = client
+    # ~16 KB on the wire, far beyond BACKLOG_MAX_BYTES once inflated
+    bomb = deflate({"ticks": [], "latest": LATEST, "pad": " " * (engine.BACKLOG_MAX_BYTES * 2)})
+    assert len(bomb) < 64 * 1024
+
+    response = http.post("/api/tick/backlog", content=bomb)
+
+    assert response.status_code == 413
@@ -0,0 +1,74 @@
+"""Retried ticks (same request_id) replay the recorded decision instead of a new one."""
+
+from conftest import Broker
+
+
+def buying_engine(fresh_engine):
+    engine = fresh_engine()
+    engine.apply_settings(engine.UserSettings(
+        rows_buy=[engine.GridRow(index=i, dollar=1.0, lots=0.01) for i in range(5)]))
+    engine.state.runtime.buy_on = True
+    engine.save_state()
+    return engine
+
+
+def test_retried_buy_is_replayed_not_filled_twice(fresh_engine):
+    engine = buying_engine(fresh_engine)
+    broker = Broker(engine)
+    rt = engine.state.runtime
+
+    # Walk down until the engine orders; that response is lost in transit
+    mid, seq = 2000.0, 0
+    while True:
+        seq += 1
+        engine.time.now += 1.0
+        mid -= 0.6
+        first = broker.tick(mid + 0.05, mid - 0.05, request_id=f"1-{seq}", lost=True)
+        if first["action"] == "BUY":
+            break
+        # Nothing to do on this tick: deliver it (the replayed WAIT) and move on
+        broker.tick(mid + 0.05, mid - 0.05, request_id=f"1-{seq}")
+    exec_before = dict(rt.buy_exec_map)
+    replays = engine.tick_metrics["replays"]
+
+    # The EA resends the same tick (same id): identical decision, replayed from the cache
+    engine.time.now += 1.5
+    retried = broker.tick(mid + 0.05, mid - 0.05, request_id=f"1-{seq}")
+    assert retried == first
+    assert engine.tick_metrics["replays"] == replays + 1
+    assert rt.buy_exec_map == exec_before
+
+    # The decision recorded its strata once; the next tick ingests exactly one fill for it
+    engine.time.now += 1.0
+    broker.tick(mid + 0.05, mid - 0.05, request_id=f"1-{seq + 1}")
+    idx = first["comment"].split("_idx")[1]
+    assert [p["comment"] for p in broker.positions.values()].count(first["comment"]) == 1
+    assert set(rt.buy_exec_map) == set(exec_before) == {idx}
+    assert rt.buy_exec_map[idx].cumulative_lots == first["volume"]
+
+
+def test_expired_request_id_is_evaluated_again(fresh_engine):
+    engine = buying_engine(fresh_engine)
+    broker = Broker(engine)
+
+    broker.tick(2000.05, 1999.95, request_id="1-1")
+    engine.time.now += engine.DISPATCH_CACHE_TTL - 0.1
+    broker.tick(2000.05, 1999.95, request_id="1-1")
+    assert engine.tick_metrics["replays"] == 1
+
+    engine.time.now += 0.2
+    broker.tick(2000.05, 1999.95, request_id="1-1")
+    assert engine.tick_metrics["replays"] == 1
+
+
+def test_cache_evicts_oldest_beyond_size(fresh_engine):
+    engine = fresh_engine()
+    cache = engine.DispatchCache(size=3, ttl=60.0)
+    for request_id in ("a", "b", "c"):
+        cache.put(request_id, {"action": request_id})
+    cache.put("a", {"action": "a"})  # re-recorded: now the newest
+    cache.put("d", {"action": "d"})
+
+    assert cache.get("b") is None
+    assert [cache.get(k)["action"] for k in ("a", "c", "d")] == ["a", "c", "d"]
+    assert len(cache.entries) == 3
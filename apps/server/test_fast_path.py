@@ -0,0 +1,106 @@
+"""
+The trigger fast path (tick_is_quiet) decides whether the decision pipeline
+runs at all. Replay randomized sessions twice, once with the fast path and once
+with it disabled, and require identical responses and end state.
+"""
+
+import asyncio
+import random
+
+import pytest
+
+from conftest import Broker
+
+SEEDS = range(12)
+TICKS = 2500
+
+
+def random_settings(engine, rng: random.Random, mid: float):
+    def rows():
+        return [
+            engine.GridRow(index=i, dollar=round(rng.uniform(0.3, 2.5), 2),
+                           lots=round(rng.uniform(0.01, 0.1), 2), alert=rng.random() < 0.2)
+            for i in range(rng.randint(3, 12))
+        ]
+
+    def tp():
+        kind = rng.choice(["fixed_money", "equity_pct", "balance_pct"])
+        return kind, round(rng.uniform(5, 40), 2) if kind == "fixed_money" else round(rng.uniform(0.05, 0.4), 3)
+
+    buy_tp, sell_tp = tp(), tp()
+    return engine.UserSettings(
+        buy_limit_price=round(mid - rng.uniform(0, 3), 2) if rng.random() < 0.3 else 0.0,
+        sell_limit_price=round(mid + rng.uniform(0, 3), 2) if rng.random() < 0.3 else 0.0,
+        buy_tp_type=buy_tp[0], buy_tp_value=buy_tp[1],
+        sell_tp_type=sell_tp[0], sell_tp_value=sell_tp[1],
+        buy_hedge_value=round(rng.uniform(20, 150), 2) if rng.random() < 0.6 else 0.0,
+        sell_hedge_value=round(rng.uniform(20, 150), 2) if rng.random() < 0.6 else 0.0,
+        rows_buy=rows(), rows_sell=rows(),
+        grid_mode=rng.choice(["fixed", "volatility"]),
+        vol_reference_atr=0.3, vol_scale_min=0.5, vol_scale_max=2.0,
+    )
+
+
+def control(engine, **switches):
+    args = {"buy_switch": None, "sell_switch": None, "cyclic": None, "emergency_close": None, "layer": "main"}
+    args.update(switches)
+    return asyncio.run(engine.control(**args))
+
+
+def run_session(engine, seed: int) -> tuple:
+    rng = random.Random(seed)
+    broker = Broker(engine)
+    mid = 2000.0
+
+    layers = ["main"] + (["swing"] if rng.random() < 0.5 else [])
+    for layer in layers:
+        if layer != engine.MAIN_LAYER:
+            engine.state.layers[layer] = engine.VectorLayer()
+        engine.apply_settings(random_settings(engine, rng, mid), layer)
+        control(engine, buy_switch=True, sell_switch=rng.random() < 0.8, cyclic=rng.random() < 0.7, layer=layer)
+
+    responses = []
+    for _ in range(TICKS):
+        engine.time.now += rng.uniform(0.2, 2.0)
+        mid += rng.gauss(0.0, 0.35)
+
+        event = rng.random()
+        if event < 0.003:
+            control(engine, **{rng.choice(["buy_switch", "sell_switch"]): rng.random() < 0.6}, layer=rng.choice(layers))
+        elif event < 0.005:
+            # Manual close of one basket in the terminal
+            hashes = sorted({p["comment"].split("_idx")[0] for p in broker.positions.values()})
+            if hashes:
+                broker.close_matching(rng.choice(hashes) + "_")
+        elif event < 0.0055:
+            control(engine, emergency_close=True)
+
+        responses.append(broker.tick(round(mid + 0.1, 2), round(mid - 0.1, 2)))
+
+    engine.update_exec_stats()
+    end_state = engine.state.model_dump()
+    end_state.pop("last_update_ts")
+    for layer in [end_state, *end_state["layers"].values()]:
+        for side in ("buy", "sell"):
+            for stats in layer["runtime"][f"{side}_exec_map"].values():
+                stats.pop("timestamp")
+    return responses, end_state, dict(engine.tick_metrics)
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_fast_path_matches_full_pipeline(fresh_engine, seed):
+    fast = fresh_engine(seed)
+    fast_responses, fast_state, fast_metrics = run_session(fast, seed)
+
+    full = fresh_engine(seed)
+    full.tick_is_quiet = lambda tick: False
+    full_responses, full_state, _ = run_session(full, seed)
+
+    for n, (a, b) in enumerate(zip(fast_responses, full_responses)):
+        assert a == b, f"tick {n}: fast path {a} != full pipeline {b}"
+    assert fast_state == full_state
+
+    # The session must exercise both paths to mean anything
+    actions = {r["action"] for r in fast_responses}
+    assert {"BUY", "SELL"} & actions and "CLOSE_ALL" in actions
+    assert 0.2 < fast_metrics["fast_path"] / fast_metrics["ticks"] < 1.0
@@ -0,0 +1,38 @@
+"""Fill tracing measures grid orders against their level and hedges against the quote."""
+
+import pytest
+
+
+def test_hedge_fill_is_measured_against_the_decision_quote(fresh_engine):
+    engine = fresh_engine()
+    st, rt = engine.state.settings, engine.state.runtime
+    # Scenario B: a running sell vector got a hedge row injected at |bid - last level|
+    rt.sell_on, rt.sell_id, rt.sell_start_ref = True, "sell_0000000c", 2000.0
+    st.rows_sell = [
+        engine.GridRow(index=0, dollar=1.0, lots=0.01),
+        engine.GridRow(index=1, dollar=1.0, lots=0.01),
+        engine.GridRow(index=2, dollar=6.0, lots=0.5, alert=True),
+    ]
+    rt.sell_exec_map = {
+        str(i): engine.RowExecStats(index=i, entry_price=2000.0 + i + 1, lots=0.01, profit=0.0, timestamp="")
+        for i in range(2)
+    }
+    engine.save_state()
+    tick = engine.TickData(account_id="1", equity=1e4, balance=1e4, symbol="XAUUSD", ask=1996.2, bid=1996.0)
+    assert abs(engine.calculate_grid_level_price("sell", 2) - tick.bid) > 5.0
+
+    tracer = engine.fill_tracer
+    for idx, hedge in ((2, True), (1, False)):
+        response = {"action": "SELL", "volume": 0.5, "comment": f"sell_0000000c_idx{idx}", "alert": True}
+        if hedge:
+            response["hedge"] = True
+        tracer.decided(response, tick, 100.0)
+        tracer.observe([engine.Position(ticket=idx, symbol="XAUUSD", type="SELL", volume=0.5,
+                                        price=tick.bid, profit=0.0, comment=response["comment"])], 101.0)
+
+    strata = tracer.report()["main"]["sell"]
+    assert strata["2"]["slippage_bps"]["count"] == 1
+    assert abs(strata["2"]["slippage_bps"]["max"]) < 1.0
+    # A grid order filled 6 below its level is adverse for a sell
+    expected = (engine.calculate_grid_level_price("sell", 1) - tick.bid) / engine.calculate_grid_level_price("sell", 1) * 1e4
+    assert strata["1"]["slippage_bps"]["max"] == pytest.approx(expected, rel=0.1)
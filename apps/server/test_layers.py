@@ -0,0 +1,52 @@
+"""Vector layers: fills are traced per layer, /api/layers is served through the tick lane."""
+
+import pytest
+from fastapi.testclient import TestClient
+
+from conftest import Broker
+
+
+def run_two_layers(engine) -> Broker:
+    broker = Broker(engine)
+    rows = [engine.GridRow(index=i, dollar=1.0, lots=0.01) for i in range(5)]
+    engine.state.layers["swing"] = engine.VectorLayer()
+    for layer in ("main", "swing"):
+        engine.apply_settings(engine.UserSettings(rows_buy=rows), layer)
+        engine.layer_parts(layer)[1].buy_on = True
+    engine.save_state()
+
+    mid = 2000.0
+    for _ in range(12):
+        engine.time.now += 1.0
+        broker.tick(round(mid + 0.05, 2), round(mid - 0.05, 2))
+        mid -= 0.6
+    return broker
+
+
+def test_fills_are_reported_per_layer(fresh_engine):
+    engine = fresh_engine()
+    run_two_layers(engine)
+
+    strata = engine.build_fills(engine.capture_fills())["strata"]
+
+    assert set(strata) == {"main", "swing"}
+    for layer in ("main", "swing"):
+        assert strata[layer]["buy"]["0"]["latency_ms"]["count"] == 1
+
+
+@pytest.mark.parametrize("mode", ["shared", "priority"])
+def test_list_layers(fresh_engine, monkeypatch, mode):
+    monkeypatch.setenv("SCHEDULING_MODE", mode)
+    engine = fresh_engine()
+    run_two_layers(engine)
+
+    with TestClient(engine.app) as http:
+        layers = http.get("/api/layers").json()
+
+    assert list(layers) == ["main", "swing"]
+    for name, layer in layers.items():
+        runtime = engine.layer_parts(name)[1]
+        assert runtime.buy_exec_map
+        assert layer["runtime"]["buy_id"] == runtime.buy_id
+        assert set(layer["runtime"]["buy_exec_map"]) == set(runtime.buy_exec_map)
+        assert layer["grid_scale"] == 1.0
@@ -0,0 +1,66 @@
+"""Incrementally maintained Position Book totals match a full re-sum."""
+
+import random
+
+import pytest
+
+HASHES = ["buy_0000000a", "buy_0000000b", "sell_0000000c"]
+
+
+def resummed(book) -> dict:
+    totals = {}
+    for hash_id, group in book.vectors.items():
+        totals[hash_id] = (
+            len(group),
+            sum(p.profit for p in group.values()),
+            sum(p.volume for p in group.values()),
+            sum(book.per_points.get(t, 0.0) for t in group),
+        )
+    return totals
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_delta_totals_match_full_resum(fresh_engine, seed):
+    engine = fresh_engine()
+    rng = random.Random(seed)
+    book = engine.PositionBook()
+    book.sync([])
+    next_ticket = 1
+    mid = 2000.0
+
+    for _ in range(2000):
+        mid += rng.gauss(0.0, 0.5)
+        bid, ask = mid - 0.1, mid + 0.1
+        upserts, closed = [], []
+        for ticket in list(book.positions):
+            roll = rng.random()
+            if roll < 0.05:
+                closed.append(ticket)
+            elif roll < 0.6:
+                p = book.positions[ticket]
+                # Occasionally a ticket moves to another vector (or loses its managed comment)
+                comment = p.comment if rng.random() > 0.01 else rng.choice(HASHES + ["manual"]) + "_idx0"
+                mark = bid if p.type == "BUY" else ask
+                sign = 1.0 if p.type == "BUY" else -1.0
+                upserts.append(p.model_copy(update={
+                    "comment": comment, "profit": round(sign * (mark - p.price) * p.volume * 100, 2)}))
+        for _ in range(rng.randint(0, 3)):
+            hash_id = rng.choice(HASHES)
+            side = "BUY" if hash_id.startswith("buy") else "SELL"
+            upserts.append(engine.Position(
+                ticket=next_ticket, symbol="XAUUSD", type=side, volume=round(rng.uniform(0.01, 1.0), 2),
+                price=ask if side == "BUY" else bid, profit=0.0, comment=f"{hash_id}_idx{next_ticket % 7}"))
+            next_ticket += 1
+
+        book.apply(upserts, closed, bid, ask)
+
+        expected = resummed(book)
+        assert set(book.totals) == set(expected)
+        for hash_id, (count, profit, volume, per_point) in expected.items():
+            assert book.count(hash_id) == count
+            assert book.profit(hash_id) == pytest.approx(profit, abs=1e-6)
+            assert book.volume(hash_id) == pytest.approx(volume, abs=1e-9)
+            assert book.per_point(hash_id) == pytest.approx(per_point, abs=1e-6)
+
+    book.sync(list(book.positions.values()), bid, ask)
+    assert book.totals == resummed(book)
@@ -0,0 +1,110 @@
+"""
+Hot standby: a primary and a standby, each an independent copy of the engine
+module, replicating over localhost.
+"""
+
+import asyncio
+import importlib.util
+import socket
+from pathlib import Path
+
+import pytest
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture
+def pair(tmp_path, monkeypatch):
+    """(primary, standby) engine modules with their own globals, state files and ports."""
+    primary_port, standby_port = free_port(), free_port()
+
+    def load(name: str, **env):
+        for key in ("ENGINE_ROLE", "REPLICATION_LISTEN", "REPLICATION_PRIMARY"):
+            monkeypatch.delenv(key, raising=False)
+        monkeypatch.setenv("STATE_FILE", str(tmp_path / f"{name}.json"))
+        for key, value in env.items():
+            monkeypatch.setenv(key, value)
+        spec = importlib.util.spec_from_file_location(name, Path(__file__).with_name("main.py"))
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        return module
+
+    primary = load("primary_engine", REPLICATION_LISTEN=f"127.0.0.1:{primary_port}")
+    standby = load("standby_engine", ENGINE_ROLE="standby",
+                   REPLICATION_PRIMARY=f"127.0.0.1:{primary_port}",
+                   REPLICATION_LISTEN=f"127.0.0.1:{standby_port}")
+    return primary, standby, primary_port
+
+
+async def wait_for(condition, timeout: float = 5.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        assert asyncio.get_running_loop().time() < deadline, "condition not met in time"
+        await asyncio.sleep(0.02)
+
+
+async def connected(primary, standby):
+    await primary.replicator.start()
+    await standby.replicator.start()
+    await wait_for(lambda: standby.replicator.has_replica)
+
+    primary.state.runtime.buy_on = True
+    primary.save_state()
+    await wait_for(lambda: standby.state.runtime.buy_on)
+
+
+async def shut_down(*engines):
+    for engine in engines:
+        if engine.replicator.server is not None:
+            engine.replicator.server.close()
+        for task in engine.replicator.tasks:
+            task.cancel()
+
+
+def test_failover_is_refused_while_primary_heartbeats(pair):
+    primary, standby, _ = pair
+
+    async def scenario():
+        await connected(primary, standby)
+        await asyncio.sleep(primary.REPLICATION_TIMEOUT * 2)
+
+        # The EA failed over, but the primary is alive: keep following
+        await standby.replicator.accept_failover()
+        assert standby.replicator.role == "standby"
+        assert standby.standby_guard().status_code == 503
+        await shut_down(primary, standby)
+
+    asyncio.run(scenario())
+
+
+def test_stalled_primary_steps_down_after_failover(pair):
+    primary, standby, primary_port = pair
+
+    async def scenario():
+        await connected(primary, standby)
+
+        # Primary stalls: no heartbeats or state reach the standby
+        primary.replicator._send = lambda line: None
+        await asyncio.sleep(primary.REPLICATION_TIMEOUT * 2)
+        # Silence alone never promotes
+        assert standby.replicator.role == "standby"
+
+        await standby.replicator.accept_failover()
+        assert standby.replicator.role == "primary"
+        assert standby.state.fence_token == primary.state.fence_token + 1
+        assert standby.state.runtime.buy_on
+        assert standby.standby_guard() is None
+
+        # The stalled primary reads the promotion and stops serving
+        await wait_for(lambda: primary.replicator.role == "deposed")
+        assert primary.standby_guard().status_code == 503
+        assert primary.replicator.server is None
+        with pytest.raises(OSError):
+            await asyncio.open_connection("127.0.0.1", primary_port)
+        await shut_down(primary, standby)
+
+    asyncio.run(scenario())
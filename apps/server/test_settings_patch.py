@@ -0,0 +1,48 @@
+"""Incremental row PATCHes edit rows in place and never remove them."""
+
+
+def test_acknowledging_hedge_row_alert_keeps_the_row(fresh_engine):
+    engine = fresh_engine()
+    rt = engine.state.runtime
+    engine.state.settings.rows_sell = [engine.GridRow(index=0, dollar=0.0, lots=0.3, alert=True)]
+    rt.sell_exec_map = {"0": engine.RowExecStats(index=0, entry_price=2000.0, lots=0.3, profit=0.0, timestamp="")}
+
+    result = engine.patch_rows("sell", [engine.RowPatch(index=0, alert=False)])
+
+    assert result["status"] == "ok"
+    assert [(r.index, r.dollar, r.lots, r.alert) for r in engine.state.settings.rows_sell] == [(0, 0.0, 0.3, False)]
+    assert "0" in rt.sell_exec_map
+
+
+def test_non_positive_gap_or_lots_is_rejected(fresh_engine):
+    engine = fresh_engine()
+    engine.state.settings.rows_buy = [
+        engine.GridRow(index=i, dollar=1.0, lots=0.01) for i in range(3)
+    ]
+    before = engine.state.model_dump()
+
+    for patch in ({"dollar": 0.0}, {"lots": -0.01}):
+        response = engine.patch_rows("buy", [engine.RowPatch(index=1, **patch)])
+        assert response.status_code == 422
+
+    # A new row needs both fields
+    response = engine.patch_rows("buy", [engine.RowPatch(index=5, dollar=1.0)])
+    assert response.status_code == 422
+
+    assert engine.state.model_dump() == before
+    assert engine.calculate_grid_level_price("buy", 2) == -3.0
+
+
+def test_patch_targets_the_requested_layer(fresh_engine):
+    engine = fresh_engine()
+    engine.state.layers["swing"] = engine.VectorLayer()
+    engine.state.layers["swing"].settings.rows_buy = [engine.GridRow(index=0, dollar=5.0, lots=0.1)]
+    engine.state.settings.rows_buy = [engine.GridRow(index=0, dollar=1.0, lots=0.01)]
+
+    result = engine.patch_rows("buy", [engine.RowPatch(index=0, dollar=7.5)], "swing")
+
+    assert result["status"] == "ok"
+    assert engine.state.layers["swing"].settings.rows_buy[0].dollar == 7.5
+    assert engine.state.settings.rows_buy[0].dollar == 1.0
+    assert engine.calculate_grid_level_price("buy", 0, "swing") == -7.5
+    assert engine.patch_rows("buy", [engine.RowPatch(index=0, dollar=2.0)], "nope").status_code == 404
@@ -0,0 +1,105 @@
+"""Volatility-scaled strata: executed gaps stay frozen, bounds are validated, statistics are per second."""
+
+import math
+import random
+
+import pytest
+
+from conftest import Broker
+
+
+def volatility_settings(engine, **overrides):
+    fields = dict(
+        rows_buy=[engine.GridRow(index=i, dollar=1.0, lots=0.01) for i in range(10)],
+        grid_mode="volatility", vol_reference_atr=1.0, vol_scale_min=0.25, vol_scale_max=2.0,
+    )
+    fields.update(overrides)
+    return engine.UserSettings(**fields)
+
+
+def quote(mid: float) -> tuple:
+    return round(mid + 0.05, 5), round(mid - 0.05, 5)
+
+
+def test_factor_change_mid_vector_only_rescales_gaps_ahead(fresh_engine):
+    engine = fresh_engine()
+    broker = Broker(engine)
+    engine.apply_settings(volatility_settings(engine))
+
+    # Warm up with 1.0 moves so the factor starts at 1.0
+    mid = 2000.0
+    for n in range(engine.VOL_WARMUP + 5):
+        engine.time.now += 1.0
+        broker.tick(*quote(mid + (n % 2)))
+    assert engine.grid_scale.get("main", 1.0) == 1.0
+
+    engine.state.runtime.buy_on = True
+    engine.save_state()
+    engine.time.now += 1.0
+    broker.tick(*quote(mid))
+    anchor = engine.state.runtime.buy_start_ref
+
+    # Walk down through five strata at the warm-up volatility
+    for _ in range(5):
+        mid -= 1.0001
+        engine.time.now += 1.0
+        assert broker.tick(*quote(mid))["action"] == "BUY"
+    assert len(engine.state.runtime.buy_exec_map) == 5
+
+    # Price goes flat (+-0.5 around the last fill) and the factor falls towards 0.5
+    responses = []
+    for n in range(150):
+        engine.time.now += 1.0
+        responses.append(broker.tick(*quote(mid + 0.5 * (n % 2))))
+    assert engine.grid_scale["main"] < 0.6
+    assert [r for r in responses if r["action"] != "WAIT"] == []
+
+    # The next strata sits one scaled gap below the frozen fifth level
+    factor = engine.grid_scale["main"]
+    assert engine.calculate_grid_level_price("buy", 4) == pytest.approx(anchor - 5.0)
+    assert engine.calculate_grid_level_price("buy", 5) == pytest.approx(anchor - 5.0 - factor)
+
+
+@pytest.mark.parametrize("overrides", [
+    {"vol_scale_min": 0.0},
+    {"vol_scale_min": 2.0, "vol_scale_max": 1.0},
+    {"vol_reference_atr": -1.0},
+])
+def test_invalid_volatility_bounds_are_rejected(fresh_engine, overrides):
+    engine = fresh_engine()
+    before = engine.state.settings.model_dump()
+    with pytest.raises(Exception):
+        engine.apply_settings(volatility_settings(engine, **overrides))
+    assert engine.state.settings.model_dump() == before
+
+
+def test_zero_scale_floor_in_saved_state_keeps_deciding(fresh_engine):
+    engine = fresh_engine()
+    broker = Broker(engine)
+    # Persisted before the bounds were validated
+    engine.state.settings = volatility_settings(engine, vol_scale_min=0.0)
+    engine.state.runtime.buy_on = True
+    engine.save_state()
+
+    for _ in range(engine.VOL_WARMUP + 10):
+        engine.time.now += 1.0
+        response = broker.tick(*quote(2000.0))
+        assert "next_poll_ms" in response
+
+
+@pytest.mark.parametrize("poll", [0.25, 1.0, 5.0])
+def test_atr_does_not_depend_on_poll_rate(fresh_engine, poll):
+    engine = fresh_engine()
+    rng = random.Random(7)
+    sigma, step = 0.1, 0.25  # price units per sqrt(second); path resolution in seconds
+    tracker = engine.VolatilityTracker()
+
+    mid, every = 2000.0, int(poll / step)
+    for n in range(engine.VOL_WINDOW * 20 * every):
+        mid += rng.gauss(0.0, sigma * math.sqrt(step))
+        if n % every == 0:
+            tracker.update(mid, n * step)
+
+    # E|dW| / sqrt(dt) = sigma * sqrt(2 / pi) at any sampling interval
+    assert tracker.atr == pytest.approx(sigma * math.sqrt(2 / math.pi), rel=0.2)
+    assert tracker.realized_vol * mid == pytest.approx(sigma, rel=0.2)
@@ -312,8 +312,10 @@ const App: React.FC = () => {
       targetRow.alert = false; // Turn off alert locally
       setLocalSettings(newSettings);
 
-      // 4. Send Update to Server
-      await handleSettingsSave(newSettings);
+      // 4. Send Update to Server (single-row patch, leaves other edits untouched)
+      await api.patchRow(side === "BUY" ? "buy" : "sell", rowIndex, {
+        alert: false,
+      });
     }
 
     setIsAcknowledging(false);
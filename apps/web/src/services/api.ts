@@ -1,4 +1,4 @@
-import { AppData, UserSettings } from "../types";
+import { AppData, GridRow, UserSettings } from "../types";
 
 const API_BASE_URL = "http://YOUR_SERVER_IP:8000";
 
@@ -44,6 +44,7 @@ export const controlSystem = async (payload: {
   sell_switch?: boolean;
   cyclic?: boolean;
   emergency_close?: boolean;
+  layer?: string; // defaults to "main" on the server
 }): Promise<boolean> => {
   try {
     const response = await fetch(`${API_BASE_URL}/api/control`, {
@@ -73,3 +74,27 @@ export const updateSettings = async (
     return false;
   }
 };
+
+export const patchRow = async (
+  side: "buy" | "sell",
+  index: number,
+  patch: Partial<Pick<GridRow, "dollar" | "lots" | "alert">> & {
+    expected_version?: number;
+  },
+  layer: string = "main"
+): Promise<boolean> => {
+  try {
+    const response = await fetch(
+      `${API_BASE_URL}/api/settings/${side}/rows/${index}?layer=${encodeURIComponent(layer)}`,
+      {
+        method: "PATCH",
+        headers: { "Content-Type": "application/json" },
+        body: JSON.stringify(patch),
+      }
+    );
+    return response.ok;
+  } catch (error) {
+    console.error("Row patch failed:", error);
+    return false;
+  }
+};
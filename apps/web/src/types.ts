@@ -9,6 +9,7 @@ export interface GridRow {
   dollar: number;       // Price gap
   lots: number;         // Volume
   alert: boolean;       // Trigger alert
+  version?: number;     // Server stamp of the last change (optimistic locking)
 }
 
 export interface RowExecStats {
@@ -35,6 +36,15 @@ export interface UserSettings {
 
   rows_buy: GridRow[];
   rows_sell: GridRow[];
+
+  buy_version?: number;
+  sell_version?: number;
+
+  // Volatility-scaled grid (opt-in)
+  grid_mode?: 'fixed' | 'volatility';
+  vol_reference_atr?: number;
+  vol_scale_min?: number;
+  vol_scale_max?: number;
 }
 
 export interface RuntimeState {
@@ -72,14 +82,30 @@ export interface RuntimeState {
   price_direction: PriceDirection;
 }
 
+export interface VolatilityStats {
+  samples: number;
+  atr: number;          // Rolling mean |mid change| per tick
+  realized_vol: number; // RMS log return over the window
+  ewma_vol: number;
+}
+
 export interface MarketState {
   history: Array<{ mid: number; ts: number }>;
   current: number;
+  volatility?: VolatilityStats;
+  grid_scale?: number;  // Gap multiplier in volatility grid mode
+}
+
+// Extra buy/sell vector pair running alongside the main one
+export interface VectorLayer {
+  settings: UserSettings;
+  runtime: RuntimeState;
 }
 
 export interface AppData {
   settings: UserSettings;
   runtime: RuntimeState;
+  layers?: Record<string, VectorLayer>;
   market: MarketState;
   last_update: string;
 }